@@ -0,0 +1,213 @@
+import io
+import json
+import math
+import os
+import re
+import subprocess
+import wave
+from typing import Dict, List, Optional, Tuple
+
+# formats whose packets ffmpeg can cut without re-encoding and the API accepts as is
+COPY_CODECS = {'mp3': 'mp3', 'opus': 'ogg'}
+TRANSCODE_BITRATE = '64k'  # speech stays clear at 64 kbps mono mp3
+SIZE_MARGIN = 0.9  # VBR files are not evenly sized, leave room under the limit
+SILENCE_NOISE = '-30dB'
+SILENCE_MIN_SECONDS = 0.5
+# a snapped segment is at least this fraction of the longest allowed one
+MIN_SEGMENT_FRACTION = 0.5
+# 16 kHz mono speech encodings for the API upload: (encoder args, extension)
+UPLOAD_CODECS = {
+    'opus': (['-c:a', 'libopus', '-b:a', '24k', '-application', 'voip'], 'ogg'),
+    'mp3': (['-c:a', 'libmp3lame', '-b:a', '32k'], 'mp3'),
+}
+# silence trimming: pauses longer than this are dropped before transcription,
+# keeping some padding around the audio on both sides
+TRIM_MIN_SILENCE = 2.0
+TRIM_PADDING = 0.25
+# whisper input: 16 kHz mono 16-bit pcm
+SAMPLE_RATE = 16000
+PCM_BYTES_PER_SECOND = SAMPLE_RATE * 2
+
+
+class FFmpegError(Exception):
+    pass
+
+
+def run(cmd: List[str]) -> subprocess.CompletedProcess:
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise FFmpegError(f"{cmd[0]} exited with {result.returncode}: {result.stderr[-1000:]}")
+    return result
+
+
+def ffmpeg(*args: str, loglevel: str = 'error') -> subprocess.CompletedProcess:
+    return run(['ffmpeg', '-hide_banner', '-loglevel', loglevel, '-nostdin', '-y', *args])
+
+
+def probe(path: str) -> Dict:
+    """Duration (seconds), bit rate (bps) and codec of the first audio stream"""
+    output = run([
+        'ffprobe', '-v', 'error', '-select_streams', 'a:0',
+        '-show_entries', 'format=duration,bit_rate:stream=codec_name',
+        '-of', 'json', path
+    ]).stdout
+    data = json.loads(output)
+    streams = data.get('streams') or [{}]
+    fmt = data.get('format', {})
+    duration = float(fmt.get('duration') or 0)
+    bit_rate = float(fmt.get('bit_rate') or 0) or (os.path.getsize(path) * 8 / duration if duration else 0)
+    return {'duration': duration, 'bit_rate': bit_rate, 'codec': streams[0].get('codec_name')}
+
+
+def segment_seconds(bit_rate: float, target_bytes: int, margin: float = SIZE_MARGIN) -> int:
+    """Longest segment that stays under `target_bytes` at `bit_rate` bits per second"""
+    return max(1, math.floor(target_bytes * 8 * margin / bit_rate))
+
+
+def detect_silences(path: str, noise: str = SILENCE_NOISE, min_seconds: float = SILENCE_MIN_SECONDS) -> List[Tuple[float, float]]:
+    """(start, end) of each silence, from ffmpeg's silencedetect filter (decodes the file, no output written)"""
+    stderr = ffmpeg('-i', path, '-vn', '-af', f'silencedetect=noise={noise}:d={min_seconds}', '-f', 'null', '-',
+                    loglevel='info').stderr
+    silences, start = [], None
+    for line in stderr.splitlines():
+        match = re.search(r'silence_(start|end): (-?[\d.]+)', line)
+        if not match:
+            continue
+        if match.group(1) == 'start':
+            start = max(0.0, float(match.group(2)))
+        elif start is not None:
+            silences.append((start, float(match.group(2))))
+            start = None
+    return silences
+
+
+def plan_cuts(silences: List[Tuple[float, float]], duration: float, max_seconds: float,
+              min_fraction: float = MIN_SEGMENT_FRACTION) -> List[float]:
+    """Cut times no more than `max_seconds` apart, each moved to the middle of the
+    latest silence in its window so words are not cut in half"""
+    cuts = []
+    position = 0.0
+    while duration - position > max_seconds:
+        earliest, latest = position + max_seconds * min_fraction, position + max_seconds
+        candidates = [(s + e) / 2 for s, e in silences if earliest <= (s + e) / 2 <= latest]
+        position = max(candidates) if candidates else latest
+        cuts.append(round(position, 3))
+    return cuts
+
+
+def sound_segments(silences: List[Tuple[float, float]], duration: float,
+                   padding: float = TRIM_PADDING) -> List[Tuple[float, float]]:
+    """(start, end) of the audio between `silences`, each widened by `padding`"""
+    segments = []
+    position = 0.0
+    for start, end in silences:
+        if start > position:
+            segments.append((position, min(start + padding, end)))
+        position = max(position, end - padding)
+    if duration - position > padding:
+        segments.append((position, duration))
+    return [(round(start, 3), round(end, 3)) for start, end in segments]
+
+
+def to_original_time(segments: List[Tuple[float, float]], t: float) -> float:
+    """Map a time in the audio trimmed to `segments` back to the original audio"""
+    offset = 0.0
+    for start, end in segments:
+        length = end - start
+        if t <= offset + length:
+            return round(start + t - offset, 3)
+        offset += length
+    return segments[-1][1] if segments else t
+
+
+def select_filter(segments: List[Tuple[float, float]]) -> str:
+    """ffmpeg audio filter keeping only `segments`, with timestamps made continuous"""
+    ranges = '+'.join(f'between(t,{start},{end})' for start, end in segments)
+    return f"aselect='{ranges}',asetpts=N/SR/TB"
+
+
+def decode_command(input_path: str, fmt: str = 'wav', segments: Optional[List[Tuple[float, float]]] = None) -> List[str]:
+    """ffmpeg command decoding to whisper's pcm format on stdout, as a wav stream or raw ('s16le'),
+    only the `segments` if given"""
+    filter_args = ['-af', select_filter(segments)] if segments else []
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin', '-i', input_path, '-vn', *filter_args,
+        '-ar', str(SAMPLE_RATE), '-ac', '1', '-c:a', 'pcm_s16le', '-f', fmt, '-'
+    ]
+
+
+def extract_segments(input_path: str, output_path: str, segments: List[Tuple[float, float]]) -> str:
+    """Write only the `segments` of the input as mono mp3"""
+    ffmpeg('-i', input_path, '-vn', '-af', select_filter(segments),
+           '-c:a', 'libmp3lame', '-b:a', TRANSCODE_BITRATE, '-ac', '1', output_path)
+    return output_path
+
+
+def wav_bytes(pcm: bytes) -> bytes:
+    """Raw pcm from `decode_command(..., 's16le')` wrapped in a wav header"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def transcode_for_upload(input_path: str, output_base: str, codec: str = 'opus',
+                         segments: Optional[List[Tuple[float, float]]] = None) -> str:
+    """Re-encode to 16 kHz mono at a speech bitrate (see UPLOAD_CODECS), only the `segments` if given
+
+    At 24 kbps Opus a 20 MB part holds almost two hours of audio.
+    """
+    codec_args, extension = UPLOAD_CODECS[codec]
+    filter_args = ['-af', select_filter(segments)] if segments else []
+    output_path = f'{output_base}.{extension}'
+    ffmpeg('-i', input_path, '-vn', *filter_args, '-ar', str(SAMPLE_RATE), '-ac', '1', *codec_args, output_path)
+    return output_path
+
+
+def split_audio(input_path: str, output_prefix: str, target_bytes: int, snap_to_silence: bool = True) -> List[str]:
+    """Split into parts smaller than `target_bytes` with ffmpeg's segment muxer
+
+    MP3 and Opus are cut by stream copy (no re-encoding), other codecs are transcoded
+    to mono mp3 on the fly. Cuts are moved to silences when `snap_to_silence` is set.
+    A file that already fits is returned as is, whatever its codec.
+    """
+    if os.path.getsize(input_path) <= target_bytes:
+        return [input_path]
+
+    info = probe(input_path)
+    codec = info['codec']
+    extension = COPY_CODECS.get(codec)
+
+    if extension:
+        codec_args, bit_rate = ['-c', 'copy'], info['bit_rate']
+    else:
+        extension = 'mp3'
+        codec_args = ['-c:a', 'libmp3lame', '-b:a', TRANSCODE_BITRATE, '-ac', '1']
+        bit_rate = int(TRANSCODE_BITRATE.rstrip('k')) * 1000
+
+    seconds = segment_seconds(bit_rate, target_bytes)
+    if snap_to_silence and info['duration']:
+        cuts = plan_cuts(detect_silences(input_path), info['duration'], seconds)
+        segment_args = ['-segment_times', ','.join(str(t) for t in cuts)] if cuts else ['-segment_time', str(seconds)]
+    else:
+        segment_args = ['-segment_time', str(seconds)]
+    print(f"Splitting {input_path} ({codec}, {info['duration']:.0f}s, {bit_rate / 1000:.0f} kbps) into segments of up to {seconds}s")
+    ffmpeg(
+        '-i', input_path, '-vn', '-map', '0:a:0', *codec_args,
+        '-f', 'segment', *segment_args, '-reset_timestamps', '1',
+        f"{output_prefix}%03d.{extension}"
+    )
+
+    directory = os.path.dirname(output_prefix) or '.'
+    name = os.path.basename(output_prefix)
+    parts = sorted(
+        os.path.join(directory, f) for f in os.listdir(directory)
+        if f.startswith(name) and f.endswith(f'.{extension}')
+    )
+    oversized = [p for p in parts if os.path.getsize(p) > target_bytes]
+    if oversized:
+        raise FFmpegError(f"Segments over {target_bytes} bytes: {oversized}")
+    return parts
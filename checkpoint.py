@@ -0,0 +1,26 @@
+import hashlib
+
+
+def content_hash(*parts) -> str:
+    """Short stable hash of the inputs of a stage"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+
+def get_checkpoint(item, stage, key, default=None):
+    """Output stored for `stage` if it was produced from the same inputs"""
+    checkpoint = item.get('checkpoints', {}).get(stage)
+    if checkpoint and checkpoint.get('hash') == key:
+        return checkpoint.get('output')
+    return default
+
+
+def set_checkpoint(item, stage, key, output):
+    item.setdefault('checkpoints', {})[stage] = {'hash': key, 'output': output}
+
+
+def clear_checkpoint(item, stage):
+    item.get('checkpoints', {}).pop(stage, None)
@@ -1,7 +1,12 @@
 import os
 import re
-from github import Github
 from env import *
+from offline import OFFLINE
+if OFFLINE:
+    from offline import StubGithub as Github
+else:
+    from github import Github
+from tracing import span
 
 GITHUB_TOKEN = os.environ['GH_TOKEN']
 
@@ -48,22 +53,26 @@ def create_markdown_file(title, transcription, date, channel_title=None):
 def get_repo():
     """Authenticates with GitHub and returns the repository object."""
     github = Github(GITHUB_TOKEN)
-    return github.get_repo(REPO_NAME)
+    with span('github.get_repo'):
+        return github.get_repo(REPO_NAME)
 
 def commit_file(repo, filename, content, branch_name):
     """Commits the new blog post markdown file to the GitHub repo and create a new branch for pr."""
     file_path = f"{POSTS_FOLDER}/{filename}"
 
-    base_branch = repo.get_branch(BRANCH_NAME)
-    repo.create_git_ref(ref=f"refs/heads/{branch_name}", sha=base_branch.commit.sha)
+    with span('github.get_branch'):
+        base_branch = repo.get_branch(BRANCH_NAME)
+    with span('github.create_git_ref'):
+        repo.create_git_ref(ref=f"refs/heads/{branch_name}", sha=base_branch.commit.sha)
 
     print(f"Creating file commit: {file_path}, branch: {branch_name}\n\n{content}")
-    repo.create_file(
-        file_path,
-        f"Add new transcript post: {filename}",
-        content,
-        branch=branch_name
-    )
+    with span('github.create_file', bytes=len(content.encode('utf-8'))):
+        repo.create_file(
+            file_path,
+            f"Add new transcript post: {filename}",
+            content,
+            branch=branch_name
+        )
     return file_path
 
 def create_pull_request(repo, filename, branch_name):
@@ -71,12 +80,13 @@ def create_pull_request(repo, filename, branch_name):
     title = f"New Blog Post: {filename}"
     body = "This is an auto-generated blog post from transcription."
 
-    pr = repo.create_pull(
-        title=title,
-        body=body,
-        head=branch_name,
-        base=BRANCH_NAME
-    )
+    with span('github.create_pull'):
+        pr = repo.create_pull(
+            title=title,
+            body=body,
+            head=branch_name,
+            base=BRANCH_NAME
+        )
     return pr.html_url
 
 def create_branch_and_pr(title, transcription, date, channel_title=None):
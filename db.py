@@ -5,6 +5,9 @@ from typing import Dict, List, Any, Optional, Union, Callable
 from pathlib import Path
 
 from selector import compile_document_selector
+from metrics import REGISTRY
+
+DB_SECONDS = REGISTRY.histogram('db_operation_seconds', 'LocalStorageDb operation latency by collection and operation')
 
 class LocalStorageDb:
     """Python implementation of LocalStorageDb using JSON files instead of localStorage"""
@@ -158,6 +161,10 @@ class Collection:
 
     def _find_fetch(self, selector: Any, options: Dict) -> List[Dict]:
         """Internal method to fetch documents"""
+        with DB_SECONDS.time(collection=self.name, op='find'):
+            return self._find_fetch_untimed(selector, options)
+
+    def _find_fetch_untimed(self, selector: Any, options: Dict) -> List[Dict]:
         if self.namespace:
             self.load_storage()
         # Deep clone to prevent modification
@@ -350,6 +357,10 @@ class Collection:
 
     def _upsert_sync(self, docs: Union[Dict, List[Dict]], bases: Optional[Union[Dict, List[Dict]]] = None):
         """Synchronous upsert implementation"""
+        with DB_SECONDS.time(collection=self.name, op='upsert'):
+            return self._upsert_sync_untimed(docs, bases)
+
+    def _upsert_sync_untimed(self, docs: Union[Dict, List[Dict]], bases: Optional[Union[Dict, List[Dict]]] = None):
         if not isinstance(docs, list):
             docs = [docs]
             single_doc = True
@@ -382,8 +393,13 @@ class Collection:
                 doc['_id'] = str(uuid.uuid4())
 
             # Replace/add
-            self._put_item(doc)
-            self._put_upsert(item)
+            self.items[doc['_id']] = doc
+            self.upserts[doc['_id']] = item
+
+        # Persist once per batch rather than once per document
+        if self.namespace:
+            self._save_items()
+            self._save_upserts()
 
         return docs[0] if single_doc else docs
 
@@ -392,7 +408,8 @@ class Collection:
         """Remove documents"""
         if success is None:
             # Synchronous mode
-            return self._remove_sync(id_or_selector)
+            with DB_SECONDS.time(collection=self.name, op='remove'):
+                return self._remove_sync(id_or_selector)
 
         # Callback mode
         try:
@@ -0,0 +1,154 @@
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    body TEXT NOT NULL,
+    sent_at REAL NOT NULL,
+    visible_at REAL NOT NULL,
+    receive_count INTEGER NOT NULL DEFAULT 0,
+    receipt_handle TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_visible_at ON messages (visible_at);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id TEXT PRIMARY KEY,
+    body TEXT NOT NULL,
+    sent_at REAL NOT NULL,
+    receive_count INTEGER NOT NULL,
+    dead_at REAL NOT NULL
+);
+"""
+
+
+class FileQueue:
+    """SQS-like queue stored in a local SQLite file
+
+    Implements the subset of the boto3 SQS client used by SqsWorker
+    (send, receive with visibility timeout, change visibility, delete, batch delete),
+    so it can replace SQS for at-least-once delivery between processes on one box.
+    Messages received more than `max_receives` times go to a dead-letter table.
+    `QueueUrl` arguments are accepted for compatibility and ignored.
+    """
+
+    def __init__(self, path: str = './data/queue.sqlite3', max_receives: int = 5, poll_interval: float = 0.5):
+        self.path = path
+        self.max_receives = max_receives
+        self.poll_interval = poll_interval
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def send_message(self, QueueUrl: Optional[str] = None, MessageBody: str = '', DelaySeconds: int = 0, **kwargs) -> Dict:
+        message_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT INTO messages (id, body, sent_at, visible_at) VALUES (?, ?, ?, ?)',
+                (message_id, MessageBody, now, now + DelaySeconds)
+            )
+        return {'MessageId': message_id}
+
+    def receive_message(self, QueueUrl: Optional[str] = None, MaxNumberOfMessages: int = 1,
+                        WaitTimeSeconds: int = 0, VisibilityTimeout: int = 30, **kwargs) -> Dict:
+        deadline = time.time() + WaitTimeSeconds
+        while True:
+            messages = self._claim(MaxNumberOfMessages, VisibilityTimeout)
+            if messages or time.time() >= deadline:
+                return {'Messages': messages}
+            time.sleep(min(self.poll_interval, max(0, deadline - time.time())))
+
+    def _claim(self, max_messages: int, visibility_timeout: int) -> List[Dict]:
+        conn = self._connect()
+        try:
+            # IMMEDIATE takes the write lock up front so two workers can't claim the same message
+            conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            conn.execute(
+                'INSERT INTO dead_letters (id, body, sent_at, receive_count, dead_at) '
+                'SELECT id, body, sent_at, receive_count, ? FROM messages WHERE visible_at <= ? AND receive_count >= ?',
+                (now, now, self.max_receives)
+            )
+            conn.execute('DELETE FROM messages WHERE visible_at <= ? AND receive_count >= ?', (now, self.max_receives))
+            rows = conn.execute(
+                'SELECT id, body, receive_count FROM messages WHERE visible_at <= ? ORDER BY sent_at LIMIT ?',
+                (now, max_messages)
+            ).fetchall()
+            messages = []
+            for message_id, body, receive_count in rows:
+                receipt_handle = f"{message_id}:{uuid.uuid4().hex}"
+                conn.execute(
+                    'UPDATE messages SET visible_at = ?, receive_count = receive_count + 1, receipt_handle = ? WHERE id = ?',
+                    (now + visibility_timeout, receipt_handle, message_id)
+                )
+                messages.append({
+                    'MessageId': message_id,
+                    'ReceiptHandle': receipt_handle,
+                    'Body': body,
+                    'Attributes': {'ApproximateReceiveCount': str(receive_count + 1)}
+                })
+            conn.execute('COMMIT')
+            return messages
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def change_message_visibility(self, QueueUrl: Optional[str] = None, ReceiptHandle: str = '', VisibilityTimeout: int = 0, **kwargs):
+        with self._connection() as conn:
+            updated = conn.execute(
+                'UPDATE messages SET visible_at = ? WHERE receipt_handle = ?',
+                (time.time() + VisibilityTimeout, ReceiptHandle)
+            ).rowcount
+        if not updated:
+            raise Exception(f"Receipt handle is no longer valid: {ReceiptHandle}")
+
+    def delete_message(self, QueueUrl: Optional[str] = None, ReceiptHandle: str = '', **kwargs):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM messages WHERE receipt_handle = ?', (ReceiptHandle,))
+
+    def delete_message_batch(self, QueueUrl: Optional[str] = None, Entries: Optional[List[Dict]] = None, **kwargs) -> Dict:
+        successful, failed = [], []
+        with self._connection() as conn:
+            for entry in Entries or []:
+                deleted = conn.execute('DELETE FROM messages WHERE receipt_handle = ?', (entry['ReceiptHandle'],)).rowcount
+                if deleted:
+                    successful.append({'Id': entry['Id']})
+                else:
+                    failed.append({'Id': entry['Id'], 'Code': 'ReceiptHandleIsInvalid', 'Message': 'Receipt handle is no longer valid'})
+        return {'Successful': successful, 'Failed': failed}
+
+    def get_queue_attributes(self, QueueUrl: Optional[str] = None, **kwargs) -> Dict:
+        now = time.time()
+        with self._connection() as conn:
+            visible = conn.execute('SELECT COUNT(*) FROM messages WHERE visible_at <= ?', (now,)).fetchone()[0]
+            in_flight = conn.execute('SELECT COUNT(*) FROM messages WHERE visible_at > ?', (now,)).fetchone()[0]
+            dead = conn.execute('SELECT COUNT(*) FROM dead_letters').fetchone()[0]
+        return {'Attributes': {
+            'ApproximateNumberOfMessages': str(visible),
+            'ApproximateNumberOfMessagesNotVisible': str(in_flight),
+            'ApproximateNumberOfDeadLetters': str(dead),
+        }}
+
+    def dead_letters(self) -> List[Dict]:
+        with self._connection() as conn:
+            rows = conn.execute('SELECT id, body, receive_count, dead_at FROM dead_letters ORDER BY dead_at').fetchall()
+        return [{'MessageId': r[0], 'Body': r[1], 'ReceiveCount': r[2], 'DeadAt': r[3]} for r in rows]
@@ -1,9 +1,19 @@
 import os
 from env import *
-from openai import AsyncOpenAI
-from google import genai
+from offline import OFFLINE
+if OFFLINE:
+    from offline import StubOpenAI as AsyncOpenAI, StubGenaiClient
+else:
+    from openai import AsyncOpenAI
+    from google import genai
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import asyncio
+import time
+
+from checkpoint import content_hash
+from tracing import span, record
+from metrics import REGISTRY
+from ratelimit import RateLimiter, estimate_tokens, is_rate_limited, retry_after
 
 openai_client = AsyncOpenAI()
 ollama_client = AsyncOpenAI(
@@ -14,9 +24,31 @@ ollama_client = AsyncOpenAI(
 basement_client = AsyncOpenAI(
     base_url=os.getenv("BASEMENT_URL"),
 )
-g_client = genai.Client(api_key=os.getenv("G_TOKEN"))
+g_client = StubGenaiClient() if OFFLINE else genai.Client(api_key=os.getenv("G_TOKEN"))
 
 lm_provider = os.getenv("LM_PROVIDER", "google")
+LM_MODELS = {
+    "openai": "gpt-5-mini",
+    "ollama": "qwen2.5",
+    "google": "gemini-3-flash-preview",
+    "basement": "deepseek-ai/deepseek-llm-7b-chat",
+}
+SCHEMA_MODEL = 'gemini-2.5-flash'
+
+limiter = None
+
+def get_limiter():
+    """The shared rate limiter, its SQLite file is only created on the first LLM call"""
+    global limiter
+    if limiter is None:
+        limiter = RateLimiter()
+    return limiter
+
+RATE_LIMIT_RETRIES = int(os.getenv('RATE_LIMIT_RETRIES', 5))
+RATE_LIMIT_PAUSE_SECONDS = float(os.getenv('RATE_LIMIT_PAUSE_SECONDS', 30))
+
+LLM_CALLS = REGISTRY.counter('llm_calls_total', 'LLM calls by provider, model and result')
+LLM_SECONDS = REGISTRY.histogram('llm_call_seconds', 'LLM call latency by provider and model')
 
 # Here are some writing samples to ground your style and tone:
 # {samples}
@@ -179,8 +211,12 @@ async def run_with_limit(tasks, concurrency_limit):
 
     return await asyncio.gather(*[asyncio.create_task(sem_task(t)) for t in tasks])
 
-async def format_transcript(transcription, n=3):
-    """split transcript into n parts and format each part"""
+async def format_transcript(transcription, n=3, cache=None, on_part=None):
+    """split transcript into chunks and format n chunks at a time
+
+    Chunks whose hash is already in `cache` are reused, `on_part(key, result)`
+    is called after each newly formatted chunk so callers can persist progress.
+    """
     if not transcription:
         return ""
 
@@ -189,8 +225,20 @@ async def format_transcript(transcription, n=3):
         chunk_overlap=0
     )
     chunks = text_splitter.split_text(transcription)
-
-    tasks = [lambda n=chunk,idx=i: format_transcript_part(n, idx+1) for i, chunk in enumerate(chunks)]
+    cache = cache if cache is not None else {}
+
+    async def format_chunk(chunk, part_n):
+        key = content_hash(chunk)
+        if key in cache:
+            print(f"------------ Reusing formatted part {part_n} -----------")
+            return cache[key]
+        result = await format_transcript_part(chunk, part_n)
+        cache[key] = result
+        if on_part:
+            on_part(key, result)
+        return result
+
+    tasks = [lambda n=chunk,idx=i: format_chunk(n, idx+1) for i, chunk in enumerate(chunks)]
     formatted_parts = await run_with_limit(tasks, concurrency_limit=n)
     return "\n".join(formatted_parts)
 
@@ -202,25 +250,81 @@ async def format_transcript_part(transcription, part_n=1):
     print(f"------------ Runtime prompt {part_n} -----------")
     print(f"{content[0:100]} ... \n(length: {len(content)})")
     print(f'------------------------------------------------')
-    return await answer_prompt(content, part_n)
+    with span('format_part', part=part_n, chars_in=len(content)) as stats:
+        res = await answer_prompt(content, part_n)
+        stats['chars_out'] = len(res)
+        return res
+
+def record_usage(response):
+    """Record token counts reported by OpenAI compatible or Gemini responses on the current span,
+    returns the total (0 when the response has no usage)"""
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        tokens_in, tokens_out = getattr(usage, 'prompt_tokens', 0) or 0, getattr(usage, 'completion_tokens', 0) or 0
+    else:
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return 0
+        tokens_in, tokens_out = getattr(usage, 'prompt_token_count', 0) or 0, getattr(usage, 'candidates_token_count', 0) or 0
+    record(tokens_in=tokens_in, tokens_out=tokens_out)
+    return tokens_in + tokens_out
 
 def answer_prompt_w_schema(content, schema):
-    response = g_client.models.generate_content(
-        model='gemini-2.5-flash',
-        contents=content,
-        config={
-            'responseSchema': schema,
-            'response_mime_type': 'application/json'
-        }
-    )
-    res = response.text
-    return res
+    # toc/faq answers are much shorter than the prompt
+    estimated = estimate_tokens(content, output_ratio=0.2)
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        waited = time.perf_counter()
+        get_limiter().acquire_sync('google', SCHEMA_MODEL, estimated)
+        record(rate_limit_wait=round(time.perf_counter() - waited, 3))
+        try:
+            with LLM_SECONDS.time(provider='google', model=SCHEMA_MODEL):
+                response = g_client.models.generate_content(
+                    model=SCHEMA_MODEL,
+                    contents=content,
+                    config={
+                        'responseSchema': schema,
+                        'response_mime_type': 'application/json'
+                    }
+                )
+        except Exception as e:
+            if is_rate_limited(e) and attempt < RATE_LIMIT_RETRIES:
+                LLM_CALLS.inc(provider='google', model=SCHEMA_MODEL, result='rate_limited')
+                get_limiter().pause('google', SCHEMA_MODEL, retry_after(e, RATE_LIMIT_PAUSE_SECONDS))
+                continue
+            LLM_CALLS.inc(provider='google', model=SCHEMA_MODEL, result='error')
+            raise
+        LLM_CALLS.inc(provider='google', model=SCHEMA_MODEL, result='ok')
+        get_limiter().settle('google', SCHEMA_MODEL, estimated, record_usage(response))
+        return response.text
 
 def print_res_summary(res, part_n=1):
     print(f"------------ Generated content {part_n} -----------")
     print(f"{res[0:100]} ... \n(length: {len(res)})")
 
 async def answer_prompt(content, part_n=1):
+    """Call the configured provider within its rate limit, waiting out 429s"""
+    model = LM_MODELS.get(lm_provider)
+    estimated = estimate_tokens(content)
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        waited = time.perf_counter()
+        await get_limiter().acquire(lm_provider, model, estimated)
+        record(rate_limit_wait=round(time.perf_counter() - waited, 3))
+        try:
+            with LLM_SECONDS.time(provider=lm_provider, model=model):
+                res, tokens = await _answer_prompt(content, part_n)
+        except Exception as e:
+            if is_rate_limited(e) and attempt < RATE_LIMIT_RETRIES:
+                print(f"Rate limited by {lm_provider}/{model} on part {part_n}, waiting (attempt {attempt + 1})")
+                LLM_CALLS.inc(provider=lm_provider, model=model, result='rate_limited')
+                get_limiter().pause(lm_provider, model, retry_after(e, RATE_LIMIT_PAUSE_SECONDS))
+                continue
+            LLM_CALLS.inc(provider=lm_provider, model=model, result='error')
+            raise
+        LLM_CALLS.inc(provider=lm_provider, model=model, result='ok')
+        get_limiter().settle(lm_provider, model, estimated, tokens)
+        return res
+
+async def _answer_prompt(content, part_n=1):
     try:
         if lm_provider == "openai":
             response = await openai_client.chat.completions.create(
@@ -230,15 +334,16 @@ async def answer_prompt(content, part_n=1):
                         "content": content,
                     }
                 ],
-                model="gpt-5-mini",
+                model=LM_MODELS["openai"],
                 max_completion_tokens=16384, # max tokens for GPT-4o-mini
             )
+            tokens = record_usage(response)
             res = response.choices[0].message.content
             if len(res.strip()) == 0:
                 raise Exception(f"Failed to generate content part {part_n}: empty response, with provider {lm_provider}")
 
             print_res_summary(res, part_n)
-            return res
+            return res, tokens
         elif lm_provider == "ollama":
             response = await ollama_client.chat.completions.create(
                 messages=[
@@ -247,22 +352,24 @@ async def answer_prompt(content, part_n=1):
                         "content": content,
                     }
                 ],
-                model="qwen2.5",
+                model=LM_MODELS["ollama"],
             )
+            tokens = record_usage(response)
             res = response.choices[0].message.content
             if len(res.strip()) == 0:
                 raise Exception(f"Failed to generate content part {part_n}: empty response, with provider {lm_provider}")
 
             print_res_summary(res, part_n)
-            return res
+            return res, tokens
         elif lm_provider == "google":
-            response = await g_client.aio.models.generate_content(model='gemini-3-flash-preview', contents=content)
+            response = await g_client.aio.models.generate_content(model=LM_MODELS["google"], contents=content)
+            tokens = record_usage(response)
             res = response.text
             if len(res.strip()) == 0:
                 raise Exception(f"Failed to generate content part {part_n}: empty response, with provider {lm_provider}")
 
             print_res_summary(res, part_n)
-            return res
+            return res, tokens
         elif lm_provider == "basement":
             response = await basement_client.chat.completions.create(
                 messages=[
@@ -271,20 +378,21 @@ async def answer_prompt(content, part_n=1):
                         "content": content,
                     }
                 ],
-                model="deepseek-ai/deepseek-llm-7b-chat",
+                model=LM_MODELS["basement"],
                 max_completion_tokens=2096, # max tokens
             )
+            tokens = record_usage(response)
             res = response.choices[0].message.content
             if len(res.strip()) == 0:
                 raise Exception(f"Failed to generate content part {part_n}: empty response, with provider {lm_provider}")
 
             print_res_summary(res, part_n)
-            return res
+            return res, tokens
         else:
             raise Exception(f"Unsupported language model provider: {lm_provider}")
     except Exception as e:
         print(f"Failed to generate content part {part_n}: {e}")
-        raise Exception(f"Failed to generate content part {part_n}: {e}")
+        raise Exception(f"Failed to generate content part {part_n}: {e}") from e
 
 def rewrite_transcript(transcription, n=3):
     lines = transcription.split("\n")
@@ -317,13 +425,15 @@ def extract_toc(text):
     runtime_prompt = get_extract_toc_template().format(content=text)
     print(f"------------ Runtime prompt -----------\n{runtime_prompt[0:100]} ... \n(length: {len(runtime_prompt)})")
     print(f'---------------------------------------\n')
-    return answer_prompt_w_schema(runtime_prompt, get_extract_toc_schema())
+    with span('extract_toc', chars_in=len(runtime_prompt)):
+        return answer_prompt_w_schema(runtime_prompt, get_extract_toc_schema())
 
 def extract_faq(text):
     runtime_prompt = get_faq_template().format(content=text)
     print(f"------------ Runtime prompt -----------\n{runtime_prompt[0:100]} ... \n(length: {len(runtime_prompt)})")
     print(f'---------------------------------------\n')
-    return answer_prompt_w_schema(runtime_prompt, get_faq_schema())
+    with span('extract_faq', chars_in=len(runtime_prompt)):
+        return answer_prompt_w_schema(runtime_prompt, get_faq_schema())
 
 if __name__ == "__main__":
     async def main():
@@ -1,4 +1,5 @@
 from env import *
+from offline import OFFLINE, sqs_client
 from datetime import datetime
 import uuid
 import hashlib
@@ -17,11 +18,15 @@ from q import main
 from q import pull_history
 from yt_liked import authenticate_youtube_from_code, authenticate_youtube, get_youtube_playlist_videos
 from db import LocalStorageDb
+from file_queue import FileQueue
+from metrics import REGISTRY
 
 
 MODE = 'local'
-sqs = boto3.client('sqs', region_name='us-west-1')
+sqs = sqs_client() if OFFLINE else boto3.client('sqs', region_name='us-west-1')
 queue_url = os.getenv('QUEUE_URL')
+FILE_QUEUE_PATH = os.getenv('FILE_QUEUE_PATH', './data/queue.sqlite3')
+file_queue = FileQueue(FILE_QUEUE_PATH)
 
 # Session secret for signing cookies
 SESSKEY_PATH = '.sesskey'
@@ -45,7 +50,7 @@ def check_auth(req, sess):
     if not token or not user or token != make_session_token(user):
         return RedirectResponse('/login', status_code=303)
 
-beforeware = Beforeware(check_auth, skip=[r'/login', r'/oauth'])
+beforeware = Beforeware(check_auth, skip=[r'/login', r'/oauth', r'/metrics'])
 
 def start_queue():
     try:
@@ -54,7 +59,7 @@ def start_queue():
         print("Shutting down job queue...")
 
 # Initialize database
-db = LocalStorageDb({'namespace': 'transcript_queue', 'storage_path': './data'})
+db = LocalStorageDb({'namespace': 'transcript_queue', 'storage_path': os.getenv('DATA_DIR', './data')})
 db.add_collection('episodes')
 
 def load_episodes(status = None):
@@ -124,6 +129,9 @@ def episode_form(i, ep):
             Div(f"Type: {ep['type']}", style="font-size: 0.8rem; margin-bottom: 0.25rem;"),
             Div(f"Published: {ep['published_date']}", style="font-size: 0.8rem; margin-bottom: 0.25rem;"),
             Div(f"Title: {ep['title']}", style="font-size: 0.9rem; font-weight: bold; margin-bottom: 0.25rem;"),
+            Div(f"Stage: {ep['stage']}", style="font-size: 0.8rem; margin-bottom: 0.25rem;") if ep['status'] == 'processing' and 'stage' in ep else None,
+            Div(f"Attempts: {ep['retry']['attempts']}, last error: {ep['retry']['error_class']}" + (f", next attempt: {ep['retry']['next_attempt_at']}" if ep['retry'].get('next_attempt_at') else ''),
+                style="font-size: 0.8rem; margin-bottom: 0.25rem; color: #a33;") if ep.get('retry') else None,
             Div(
                 "Status: ",
                 status_button("error", "error"),
@@ -131,6 +139,9 @@ def episode_form(i, ep):
                 status_button("queued", "queued"),
                 status_button("done", "done"),
                 status_button("skip", "skip"),
+                " Priority: ",
+                Input(type="number", name="priority", value=ep.get('priority', 0), title="higher runs first",
+                    style="width: 4rem; font-size: 0.8rem; margin: 0; padding: 2px 4px; height: initial; display: inline-block;"),
                 style="margin: 0.25rem 0; font-size: 0.8rem;"
             ),
             Div(
@@ -191,6 +202,7 @@ def get(status: str = 'todo', source: str = ''):
                 status_link('queued', 'queued'), " | ",
                 status_link('processing', 'processing'), " | ",
                 status_link('done', 'done'), " | ",
+                status_link('retry', 'retry'), " | ",
                 status_link('error', 'error'), " | ",
                 status_link('skip', 'skip'),
                 style="font-size:0.85rem;"
@@ -234,14 +246,22 @@ function playEpisodeUrl(url, title) {
     )
 
 @rt("/update")
-def post(id: str, status: str, url: str):
+def post(id: str, status: str, url: str, priority: int = 0):
     ep = db.episodes.find_one({ '_id': id })
     ep['status'] = status
-
-    if MODE == 'sqs' and status == 'queued':
-        print(f"Sending message to queue {queue_url}: {ep}")
-        response = sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps(ep))
-        print("SQS MessageId: ", response['MessageId'])
+    ep['priority'] = priority
+    if status == 'queued':
+        # manual re-queue starts with a fresh retry budget
+        ep['retry'] = None
+        ep['queued_at'] = datetime.now().isoformat()
+
+    if MODE in ('sqs', 'file') and status == 'queued':
+        client, url = (sqs, queue_url) if MODE == 'sqs' else (file_queue, FILE_QUEUE_PATH)
+        print(f"Sending message to queue {url}: {ep}")
+        # segments can be large, the worker reads them from the db (SQS bodies are limited to 256 KB)
+        body = {k: v for k, v in ep.items() if k != 'segments'}
+        response = client.send_message(QueueUrl=url, MessageBody=json.dumps(body))
+        print(f"{MODE} MessageId: ", response['MessageId'])
 
     insert_episode(ep)
     return episode_form(id, ep)
@@ -289,12 +309,33 @@ def get(request):
     authenticate_youtube_from_code(code)
     return RedirectResponse('/', status_code=303)
 
+EPISODES = REGISTRY.gauge('transcript_episodes', 'Episodes by status')
+QUEUE_MESSAGES = REGISTRY.gauge('transcript_queue_messages', 'File queue messages by state')
+
+@rt("/metrics")
+def get():
+    counts = {}
+    for ep in db.episodes.find({}).fetch():
+        counts[ep.get('status', 'todo')] = counts.get(ep.get('status', 'todo'), 0) + 1
+    EPISODES.clear()
+    for status, count in counts.items():
+        EPISODES.set(count, status=status)
+    if MODE == 'file':
+        attributes = file_queue.get_queue_attributes()['Attributes']
+        QUEUE_MESSAGES.set(int(attributes['ApproximateNumberOfMessages']), state='visible')
+        QUEUE_MESSAGES.set(int(attributes['ApproximateNumberOfMessagesNotVisible']), state='in_flight')
+        QUEUE_MESSAGES.set(int(attributes['ApproximateNumberOfDeadLetters']), state='dead')
+    # merges the snapshots written by queue worker processes
+    return Response(REGISTRY.render(include_snapshots=True), media_type='text/plain; version=0.0.4; charset=utf-8')
+
 serve(port=int(os.getenv('PORT', 5001)))
 
-authenticate_youtube()
+if not OFFLINE:
+    authenticate_youtube()
 
 parser = argparse.ArgumentParser(description="Transcript Queue")
-parser.add_argument("--mode", choices=["local", "sqs"], default='local', help="local queue or SQS queue")
+parser.add_argument("--mode", choices=["local", "sqs", "file"], default='local', help="local queue, SQS queue or SQLite file queue")
+parser.add_argument("--offline", action="store_true", help="use local stubs instead of external services")
 args = parser.parse_args()
 
 MODE = args.mode
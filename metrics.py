@@ -0,0 +1,221 @@
+import json
+import os
+import time
+import bisect
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+METRICS_DIR = os.getenv('METRICS_DIR', './data/metrics')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def format_labels(key: LabelKey, extra: Optional[Dict] = None) -> str:
+    pairs = list(key) + sorted((extra or {}).items())
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[LabelKey, float] = {}
+        self.lock = threading.Lock()
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {'type': self.type, 'help': self.help,
+                    'values': [[list(map(list, k)), v] for k, v in self.values.items()]}
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+    def render(self, values) -> List[str]:
+        return [f"{self.name}{format_labels(k)} {v}" for k, v in values.items()]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = list(buckets)
+
+    def observe(self, value: float, **labels):
+        key = label_key(labels)
+        with self.lock:
+            # [count per bucket..., +Inf count, sum]
+            state = self.values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            state[bisect.bisect_left(self.buckets, value)] += 1
+            state[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def snapshot(self) -> Dict:
+        data = super().snapshot()
+        data['buckets'] = self.buckets
+        return data
+
+    def render(self, values) -> List[str]:
+        lines = []
+        for key, state in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], state[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(key, {'le': str(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {state[-1]}")
+            lines.append(f"{self.name}_count{format_labels(key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    """In-process metrics, rendered in the Prometheus text format
+
+    Worker processes write snapshots to METRICS_DIR with `dump`, the web app
+    merges them with `render(include_snapshots=True)`.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def _get(self, cls, name, help, **kwargs):
+        if name not in self.metrics:
+            self.metrics[name] = cls(name, help, **kwargs)
+        return self.metrics[name]
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def snapshot(self) -> Dict:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def dump(self, directory: str = METRICS_DIR):
+        """Write this process's metrics so another process can serve them"""
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'pid': os.getpid(), 'time': time.time(), 'metrics': self.snapshot()}, f)
+        os.replace(tmp_path, path)
+
+    def remove_dump(self, directory: str = METRICS_DIR):
+        try:
+            os.remove(os.path.join(directory, f"{os.getpid()}.json"))
+        except OSError:
+            pass
+
+    def render(self, include_snapshots: bool = False, directory: str = METRICS_DIR) -> str:
+        snapshots = [self.snapshot()]
+        if include_snapshots:
+            snapshots += load_snapshots(directory)
+
+        merged: Dict[str, Tuple[Metric, Dict]] = {}
+        for snapshot in snapshots:
+            for name, data in snapshot.items():
+                if name not in merged:
+                    cls = {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}.get(data['type'], Metric)
+                    metric = cls(name, data['help'], buckets=data['buckets']) if cls is Histogram else cls(name, data['help'])
+                    merged[name] = (metric, {})
+                values = merged[name][1]
+                for key, value in data['values']:
+                    key = tuple(tuple(pair) for pair in key)
+                    if key not in values:
+                        values[key] = list(value) if isinstance(value, list) else value
+                    elif isinstance(value, list):
+                        values[key] = [a + b for a, b in zip(values[key], value)]
+                    else:
+                        # sum across processes, e.g. jobs in flight per process
+                        values[key] += value
+
+        lines = []
+        for name, (metric, values) in sorted(merged.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            lines.extend(metric.render(values))
+        return '\n'.join(lines) + '\n'
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def load_snapshots(directory: str = METRICS_DIR) -> List[Dict]:
+    """Metrics dumped by other live processes"""
+    snapshots = []
+    for path in Path(directory).glob('*.json'):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            continue
+        if data.get('pid') == os.getpid() or not _alive(data.get('pid', -1)):
+            continue
+        snapshots.append(data['metrics'])
+    return snapshots
+
+
+REGISTRY = Registry()
@@ -0,0 +1,235 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+from urllib.parse import urlparse, parse_qs
+
+# Detected at import, before the other modules create their API clients
+OFFLINE = os.getenv('OFFLINE', '').lower() in ('1', 'true', 'yes') or '--offline' in sys.argv
+
+OFFLINE_DATA_DIR = os.getenv('OFFLINE_DATA_DIR', './data/offline')
+OFFLINE_EPISODES = int(os.getenv('OFFLINE_EPISODES', 20))
+OFFLINE_VIDEOS = int(os.getenv('OFFLINE_VIDEOS', 10))
+
+# Seconds per call unless noted, override with OFFLINE_LATENCY_<NAME>
+LATENCIES = {
+    'pocketcasts': 1.0,        # history and show notes
+    'youtube': 0.5,            # liked videos
+    'caption': 0.5,            # one youtube caption download
+    'transcribe': 0.02,        # per second of audio, i.e. the real-time factor
+    'llm': 1.0,                # per call
+    'llm_per_1k_tokens': 0.5,  # per 1k completion tokens
+    'github': 0.2,             # per API call
+}
+
+WORDS = ('the', 'model', 'podcast', 'we', 'talked', 'about', 'market', 'china', 'data', 'and',
+         'so', 'really', 'think', 'policy', 'growth', 'energy', 'that', 'is', 'interesting', 'right')
+CHARS_PER_AUDIO_SECOND = 15
+
+
+def latency(name: str) -> float:
+    return float(os.getenv(f'OFFLINE_LATENCY_{name.upper()}', LATENCIES[name]))
+
+
+def use_offline_paths():
+    """Keep offline runs away from the real data dir: episode db, queues, rate limit buckets, caches and work files"""
+    os.environ.setdefault('DATA_DIR', OFFLINE_DATA_DIR)
+    os.environ.setdefault('FILE_QUEUE_PATH', f'{OFFLINE_DATA_DIR}/queue.sqlite3')
+    os.environ.setdefault('RATE_LIMIT_PATH', f'{OFFLINE_DATA_DIR}/ratelimit.sqlite3')
+    os.environ.setdefault('TRACE_FILE', f'{OFFLINE_DATA_DIR}/traces.jsonl')
+    os.environ.setdefault('METRICS_DIR', f'{OFFLINE_DATA_DIR}/metrics')
+    os.environ.setdefault('TRANSCRIPT_CACHE_DIR', f'{OFFLINE_DATA_DIR}/transcripts')
+    os.environ.setdefault('WORK_DIR', f'{OFFLINE_DATA_DIR}/work')
+    os.environ.setdefault('DOWNLOAD_DIR', f'{OFFLINE_DATA_DIR}/downloads')
+    os.environ.setdefault('WHISPER_STATS_FILE', f'{OFFLINE_DATA_DIR}/whisper_rtf.json')
+    os.environ.setdefault('GH_TOKEN', 'offline')
+    os.environ.setdefault('PCUSER', 'offline')
+    os.environ.setdefault('PCPW', 'offline')
+
+
+if OFFLINE:
+    use_offline_paths()
+    print(f'Offline mode: stub providers, data in {OFFLINE_DATA_DIR}')
+
+
+def fake_text(seed: str, chars: int) -> str:
+    rng = random.Random(seed)
+    words, length = [], 0
+    while length < chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    lines = [' '.join(words[i:i + 12]) for i in range(0, len(words), 12)]
+    return '\n'.join(lines)
+
+
+def tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+# ----------- Sources -----------
+
+def pocketcasts_history():
+    time.sleep(latency('pocketcasts'))
+    episodes = []
+    for i in range(OFFLINE_EPISODES):
+        rng = random.Random(f'pocketcasts-{i}')
+        duration = rng.randint(600, 5400)
+        episodes.append({
+            'uuid': f'offline-episode-{i}',
+            # the stub transcriber reads the duration back from the url
+            'url': f'https://offline.invalid/pocketcasts/{i}.mp3?duration={duration}',
+            'published': f'2025-01-{i % 28 + 1:02d}T00:00:00Z',
+            'duration': duration,
+            'size': str(duration * 16000),
+            'title': f'Offline episode {i}',
+            'podcastUuid': f'offline-podcast-{i % 3}',
+            'podcastTitle': f'Offline podcast {i % 3}',
+            'podcastSlug': f'offline-podcast-{i % 3}',
+            'author': 'Offline',
+            'pod_notes': f'Offline podcast {i % 3}',
+            'episode_notes': 'Show notes',
+        })
+    return episodes, 'offline-token'
+
+
+def youtube_liked_videos():
+    time.sleep(latency('youtube'))
+    return [{
+        'id': f'offline{i}',
+        'url': f'https://www.youtube.com/watch?v=offline{i}',
+        'title': f'Offline video {i}',
+        'prog_slug': 'offline-channel',
+        'published_date': f'2025-02-{i % 28 + 1:02d}',
+    } for i in range(OFFLINE_VIDEOS)]
+
+
+async def download_caption(video_url: str) -> str:
+    await asyncio.sleep(latency('caption'))
+    seconds = random.Random(video_url).randint(300, 3600)
+    return fake_text(video_url, seconds * CHARS_PER_AUDIO_SECOND)
+
+
+async def transcribe_from_url(audio_url: str, show_notes: str) -> str:
+    """Takes `duration` x the transcribe latency, like whisper at a fixed real-time factor"""
+    query = parse_qs(urlparse(audio_url).query)
+    seconds = int(query.get('duration', [1800])[0])
+    await asyncio.sleep(seconds * latency('transcribe'))
+    return fake_text(audio_url, seconds * CHARS_PER_AUDIO_SECOND)
+
+
+# ----------- LLM and whisper clients -----------
+
+def chat_response(content: str, completion: str):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=completion))],
+        usage=SimpleNamespace(prompt_tokens=tokens(content), completion_tokens=tokens(completion)),
+    )
+
+
+def llm_delay(completion: str) -> float:
+    return latency('llm') + tokens(completion) / 1000 * latency('llm_per_1k_tokens')
+
+
+class _Completions:
+    async def create(self, messages, model=None, **kwargs):
+        content = messages[-1]['content']
+        # formatting keeps the text word by word, so echo the prompt
+        await asyncio.sleep(llm_delay(content))
+        return chat_response(content, content)
+
+
+class _Transcriptions:
+    async def create(self, model=None, file=None, response_format=None, **kwargs):
+        data = file.read() if file else b''
+        seconds = len(data) // 16000
+        await asyncio.sleep(len(data) / 16000 * latency('transcribe'))
+        text = fake_text(hashlib.sha256(data).hexdigest(), seconds * CHARS_PER_AUDIO_SECOND)
+        if response_format != 'verbose_json':
+            return SimpleNamespace(text=text)
+        segment = SimpleNamespace(start=0.0, end=float(seconds), text=text, avg_logprob=-0.2)
+        return SimpleNamespace(text=text, duration=float(seconds), segments=[segment])
+
+
+class StubOpenAI:
+    """Stands in for AsyncOpenAI chat completions and transcriptions"""
+
+    def __init__(self, *args, **kwargs):
+        self.chat = SimpleNamespace(completions=_Completions())
+        self.audio = SimpleNamespace(transcriptions=_Transcriptions())
+
+
+def genai_response(contents: str, text: str):
+    return SimpleNamespace(
+        text=text,
+        usage_metadata=SimpleNamespace(prompt_token_count=tokens(contents), candidates_token_count=tokens(text)),
+    )
+
+
+def schema_answer(schema) -> str:
+    """Empty lists for the array properties of the toc and faq schemas"""
+    properties = (schema or {}).get('properties', {})
+    return json.dumps({name: [] for name, prop in properties.items() if prop.get('type') == 'array'})
+
+
+class _Models:
+    def generate_content(self, model=None, contents='', config=None):
+        text = schema_answer(config.get('responseSchema')) if config else contents
+        time.sleep(llm_delay(text))
+        return genai_response(contents, text)
+
+
+class _AsyncModels:
+    async def generate_content(self, model=None, contents='', config=None):
+        text = schema_answer(config.get('responseSchema')) if config else contents
+        await asyncio.sleep(llm_delay(text))
+        return genai_response(contents, text)
+
+
+class StubGenaiClient:
+    def __init__(self, *args, **kwargs):
+        self.models = _Models()
+        self.aio = SimpleNamespace(models=_AsyncModels())
+
+
+# ----------- GitHub and SQS -----------
+
+class _Repo:
+    pull_count = 0
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_branch(self, branch):
+        time.sleep(latency('github'))
+        return SimpleNamespace(commit=SimpleNamespace(sha=hashlib.sha1(branch.encode()).hexdigest()))
+
+    def create_git_ref(self, ref, sha):
+        time.sleep(latency('github'))
+
+    def create_file(self, path, message, content, branch=None):
+        time.sleep(latency('github'))
+
+    def create_pull(self, title, body, head, base):
+        time.sleep(latency('github'))
+        _Repo.pull_count += 1
+        return SimpleNamespace(html_url=f'https://github.invalid/{self.name}/pull/{_Repo.pull_count}')
+
+
+class StubGithub:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_repo(self, name):
+        time.sleep(latency('github'))
+        return _Repo(name)
+
+
+def sqs_client():
+    """SQS is replaced by a SQLite file queue, which implements the same client calls"""
+    from file_queue import FileQueue
+    return FileQueue(f'{OFFLINE_DATA_DIR}/sqs.sqlite3')
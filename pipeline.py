@@ -0,0 +1,159 @@
+import asyncio
+import contextvars
+import inspect
+import traceback
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+@dataclass
+class Stage:
+    """A pipeline step: `run(item)` returns the (updated) item handed to the next stage"""
+    name: str
+    run: Callable[[Dict], Awaitable[Dict]]
+    concurrency: int = 1
+    queue_size: int = 0  # 0 means the same as concurrency
+
+
+@dataclass
+class Job:
+    """An episode travelling through the pipeline, with completion callbacks"""
+    item: Dict
+    on_done: Optional[Callable] = None
+    on_error: Optional[Callable] = None
+    # called by `Pipeline.close` when the job was still unfinished, e.g. to hand it back to the queue
+    on_cancel: Optional[Callable] = None
+    meta: Dict[str, Any] = field(default_factory=dict)
+    # stages run in this context, e.g. to carry the job's trace across stages
+    context: Optional[contextvars.Context] = None
+
+
+async def _call(callback, *args):
+    if callback is None:
+        return
+    result = callback(*args)
+    if inspect.isawaitable(result):
+        await result
+
+
+class Pipeline:
+    """Stages connected by bounded queues, each stage running its own pool of workers
+
+    A job moves to the next stage as soon as a stage worker finishes it, so a slow
+    stage (e.g. whisper) does not block other jobs in faster stages (e.g. LLM calls).
+    Bounded queues give backpressure: `submit` waits while the first stage is full.
+    """
+
+    def __init__(self, stages: List[Stage], on_stage: Optional[Callable] = None):
+        self.stages = stages
+        self.on_stage = on_stage
+        self.queues = [asyncio.Queue(maxsize=s.queue_size or s.concurrency) for s in stages]
+        self.tasks: List[asyncio.Task] = []
+        self.in_flight = 0
+        # submitted and not finished yet, by id() as jobs are compared by value
+        self.jobs: Dict[int, Job] = {}
+        # first stage slots promised to callers that will submit soon, see reserve
+        self.reserved = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def start(self):
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.concurrency):
+                self.tasks.append(asyncio.create_task(self._worker(index, n + 1)))
+        print('Pipeline started: ' + ', '.join(f"{s.name} x{s.concurrency}" for s in self.stages))
+
+    async def submit(self, job: Job, reserved: bool = False):
+        """Queue a job for the first stage, `reserved` uses a slot taken with `reserve`"""
+        if reserved:
+            # no await before the put, so nobody else can take the slot
+            self.reserved -= 1
+        self.in_flight += 1
+        self.idle.clear()
+        self.jobs[id(job)] = job
+        try:
+            await self.queues[0].put(job)
+        except BaseException:
+            # cancelled while waiting for room, the job was never taken
+            self.jobs.pop(id(job), None)
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self.idle.set()
+            raise
+
+    def free_slots(self) -> int:
+        """Jobs `submit` would take right now without waiting"""
+        queue = self.queues[0]
+        return queue.maxsize - queue.qsize() - self.reserved
+
+    def reserve(self, n: int) -> int:
+        """Hold up to `n` free slots, e.g. before receiving that many messages, returns how many were held
+
+        Each held slot is used by `submit(job, reserved=True)` or given back with `release`.
+        """
+        n = max(0, min(n, self.free_slots()))
+        self.reserved += n
+        return n
+
+    def release(self, n: int):
+        self.reserved -= n
+
+    async def join(self):
+        """Wait until every submitted job has finished or failed"""
+        await self.idle.wait()
+
+    async def close(self):
+        """Cancel the stage workers, jobs that did not finish get their `on_cancel` callback"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        cancelled, self.jobs = list(self.jobs.values()), {}
+        for job in cancelled:
+            try:
+                await _call(job.on_cancel, job)
+            except Exception as e:
+                print(f"Pipeline: cancel callback failed for {job.item.get('url')}: {e}")
+                traceback.print_exc()
+        self.in_flight = 0
+        self.idle.set()
+
+    async def _finish(self, job: Job, error: Optional[Exception]):
+        try:
+            if error is None:
+                await _call(job.on_done, job)
+            else:
+                await _call(job.on_error, job, error)
+        except Exception as e:
+            print(f"Pipeline: completion callback failed for {job.item.get('url')}: {e}")
+            traceback.print_exc()
+        finally:
+            self.jobs.pop(id(job), None)
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self.idle.set()
+
+    async def _worker(self, index: int, n: int):
+        stage = self.stages[index]
+        queue = self.queues[index]
+        while True:
+            job = await queue.get()
+            try:
+                await _call(self.on_stage, job, stage.name)
+                if job.context is None:
+                    job.item = await stage.run(job.item)
+                else:
+                    job.item = await asyncio.create_task(stage.run(job.item), context=job.context)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Stage {stage.name}#{n}: error processing {job.item.get('url')}: {e}")
+                traceback.print_exc()
+                await self._finish(job, e)
+            else:
+                if index + 1 < len(self.stages):
+                    await self.queues[index + 1].put(job)
+                else:
+                    await self._finish(job, None)
+            finally:
+                queue.task_done()
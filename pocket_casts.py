@@ -2,8 +2,10 @@ import os
 import requests
 import json
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 from env import *
+import offline
 
 WHISPER_CONTEXT_FILE = Path('whisper_context.json')
 whisper_context = {}
@@ -12,6 +14,8 @@ with open(WHISPER_CONTEXT_FILE, 'r') as f:
 
 pocketcasts_user = os.environ['PCUSER']
 pocketcasts_pw = os.environ['PCPW']
+REQUEST_TIMEOUT = 30
+SHOW_NOTES_WORKERS = 8
 
 samples = [{
     "uuid": "46002fcb-8a68-4ce9-8240-43d25fdd3ec5",
@@ -42,7 +46,7 @@ def get_pocketcasts_episode_notes(pod_uuid, episode_uuid):
 
     print(f'Fetching show notes for {pod_uuid} ...')
     notes_url = f'https://podcast-api.pocketcasts.com/mobile/show_notes/full/{pod_uuid}'
-    response = requests.get(notes_url, allow_redirects=True)
+    response = requests.get(notes_url, allow_redirects=True, timeout=REQUEST_TIMEOUT)
     response_data = response.json()
     episodes = response_data['podcast']['episodes']
     for ep in episodes:
@@ -50,12 +54,31 @@ def get_pocketcasts_episode_notes(pod_uuid, episode_uuid):
 
     return episode_notes_cache.get(episode_uuid, None)
 
+def prefetch_show_notes(episodes):
+    """Fetch show notes of every podcast in `episodes` concurrently, one request per podcast"""
+    pod_uuids = {ep['podcastUuid'] for ep in episodes if ep['uuid'] not in episode_notes_cache}
+
+    def fetch(pod_uuid):
+        try:
+            # any episode uuid works, the whole podcast is cached
+            get_pocketcasts_episode_notes(pod_uuid, None)
+        except Exception as e:
+            print(f'Failed to fetch show notes for {pod_uuid}: {e}')
+
+    with ThreadPoolExecutor(max_workers=SHOW_NOTES_WORKERS) as executor:
+        list(executor.map(fetch, pod_uuids))
+
+def get_author_notes(pod_title):
+    return whisper_context[pod_title] if pod_title in whisper_context else pod_title
+
 def get_show_notes(pod_title, pod_uuid, episode_uuid):
-    author_notes = whisper_context[pod_title] if pod_title in whisper_context else pod_title
+    author_notes = get_author_notes(pod_title)
     episode_notes = get_pocketcasts_episode_notes(pod_uuid, episode_uuid)
     return author_notes, episode_notes
 
 def get_pocketcasts_history():
+    if offline.OFFLINE:
+        return offline.pocketcasts_history()
     login_url = "https://api.pocketcasts.com/user/login"
     login_payload = {
         "email": pocketcasts_user,
@@ -64,19 +87,22 @@ def get_pocketcasts_history():
     }
     login_headers = {"Content-Type": "application/json"}
 
-    login_response = requests.post(login_url, json=login_payload, headers=login_headers)
+    login_response = requests.post(login_url, json=login_payload, headers=login_headers, timeout=REQUEST_TIMEOUT)
     login = login_response.json()
     token = login['token']
 
     history_url = "https://api.pocketcasts.com/user/history"
     history_headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
 
-    history_response = requests.post(history_url, headers=history_headers)
+    history_response = requests.post(history_url, headers=history_headers, timeout=REQUEST_TIMEOUT)
     history = history_response.json()
     episodes = history['episodes']
 
+    prefetch_show_notes(episodes)
     for ep in episodes:
-        ep['pod_notes'], ep['episode_notes'] = get_show_notes(ep['podcastTitle'], ep['podcastUuid'], ep['uuid'])
+        ep['pod_notes'] = get_author_notes(ep['podcastTitle'])
+        # notes of podcasts that failed to fetch are left empty rather than failing the pull
+        ep['episode_notes'] = episode_notes_cache.get(ep['uuid'], None)
 
     return episodes, token
 
@@ -0,0 +1,43 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Rough throughput figures used to estimate how long an episode takes to publish
+SPEECH_CHARS_PER_SECOND = 15       # transcript length per second of audio
+FORMAT_SECONDS_PER_CHAR = 0.003    # LLM formatting, chunks run in parallel
+WHISPER_REALTIME_FACTOR = 0.25     # transcription seconds per second of audio
+DOWNLOAD_BYTES_PER_SECOND = 5_000_000
+CAPTION_SECONDS = 5
+DEFAULT_DURATION = 3600            # when the source doesn't tell us
+AGING_HOURS = 1.0                  # waiting this long halves the estimated cost
+
+
+def estimate_cost(ep: Dict) -> float:
+    """Estimated seconds of work left before the episode is published"""
+    if 'transcript' in ep:
+        return len(ep['transcript'] or '') * FORMAT_SECONDS_PER_CHAR
+
+    duration = float(ep.get('duration') or DEFAULT_DURATION)
+    format_cost = duration * SPEECH_CHARS_PER_SECOND * FORMAT_SECONDS_PER_CHAR
+    if ep.get('type') == 'youtube':
+        return CAPTION_SECONDS + format_cost
+
+    download_cost = float(ep.get('size') or 0) / DOWNLOAD_BYTES_PER_SECOND
+    return download_cost + duration * WHISPER_REALTIME_FACTOR + format_cost
+
+
+def waited_hours(ep: Dict, now: datetime) -> float:
+    queued_at = ep.get('queued_at')
+    if not queued_at:
+        return 0
+    return max(0, (now - datetime.fromisoformat(queued_at)).total_seconds() / 3600)
+
+
+def sort_key(ep: Dict, now: datetime):
+    """Higher priority first, then shortest job first, with cost shrinking while an episode waits"""
+    aged_cost = estimate_cost(ep) / (1 + waited_hours(ep, now) / AGING_HOURS)
+    return (-int(ep.get('priority') or 0), aged_cost)
+
+
+def pick_next(episodes: List[Dict], now: Optional[datetime] = None) -> Optional[Dict]:
+    now = now or datetime.now()
+    return min(episodes, key=lambda ep: sort_key(ep, now), default=None)
@@ -1,38 +1,60 @@
 import json
+import time
+import random
 import asyncio
+import contextvars
+import signal
+import multiprocessing
 from datetime import datetime
 import argparse
 import traceback
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dataclasses import dataclass
 import boto3
-from xml.etree.ElementTree import ParseError
 
 from env import *
+from offline import OFFLINE, sqs_client
 from pocket_casts import get_pocketcasts_history
 from yt_liked import get_youtube_liked_videos
 from yt_subtitle import download_caption
-from whisper import transcribe_from_url
+from whisper import transcribe_from_url, warm_up, share_cpu
+import segments as transcript_segments
 from create_pr import create_branch_and_pr, format_pr_content
-from format import format_transcript, extract_toc, extract_faq
+from format import format_transcript, extract_toc, extract_faq, get_template, lm_provider
 from db import LocalStorageDb
+from pipeline import Pipeline, Stage, Job
+from tracing import start_trace, finish_trace, traced
+from schedule import CronSchedule, next_run, due_sources
+from sqs_worker import SqsWorker, MAX_BATCH
+from file_queue import FileQueue
+from checkpoint import content_hash, get_checkpoint, set_checkpoint, clear_checkpoint
+from retry import next_retry, MissingData
+from priority import pick_next, sort_key
+from metrics import REGISTRY
 
 # Initialize database
-db = LocalStorageDb({'namespace': 'transcript_queue', 'storage_path': './data'})
+db = LocalStorageDb({'namespace': 'transcript_queue', 'storage_path': os.getenv('DATA_DIR', './data')})
 db.add_collection('episodes')
+db.add_collection('schedule')
 
-sqs = boto3.client('sqs', region_name='us-west-1')
+sqs = sqs_client() if OFFLINE else boto3.client('sqs', region_name='us-west-1')
 queue_url = os.getenv('QUEUE_URL')
 
-async def get_caption_worker(url: str, show_notes: str, type='pocketcasts'):
+FILE_QUEUE_PATH = os.getenv('FILE_QUEUE_PATH', './data/queue.sqlite3')
+file_queue = FileQueue(FILE_QUEUE_PATH, max_receives=int(os.getenv('FILE_QUEUE_MAX_RECEIVES', 5)))
+
+async def get_caption_worker(url: str, show_notes: str, type='pocketcasts', size=None):
+    """Returns (transcript, timed segments or None), None if it could not be fetched"""
     print(f"Processing caption for URL {type}: {url}")
-    transcription = None
+    result = None
     if type == 'pocketcasts':
-        transcription = await transcribe_from_url(url, show_notes)
+        result = await transcribe_from_url(url, show_notes, size)
     elif type == 'youtube':
-        transcription = await download_caption(url)
+        caption = await download_caption(url)
+        result = (caption, None) if caption is not None else None
 
     print(f"Processed caption for URL {type}: {url}")
-    return transcription
+    return result
 
 @dataclass
 class PocketCast:
@@ -74,243 +96,770 @@ class Youtube:
             'type': self.type
         })
 
-def pull_history():
+def fetch_pocketcasts():
+    """Fetch Pocketcasts listening history as (message, episode) pairs"""
     print("Fetching new Podcasts episode URLs...")
-    all_messages = []
-
-    # --------- Add Pocketcasts URLs ---------
     urls, _ = get_pocketcasts_history()
-    i = 0
-    for item in urls:
-        if not db.episodes.find_one({'url': item['url']}):
-            i += 1
-            all_messages.append(PocketCast(
-                url=item['url'],
-                title=item['title'],
-                prog_slug=item['podcastSlug'],
-                author=item['author'],
-                pod_notes=item['pod_notes'],
-                episode_notes=item['episode_notes'],
-                published_date=item['published'].split('T')[0]
-            ))
-            episode_data = {
-                'type': 'pocketcasts',
-                'url': item['url'],
-                'status': 'todo',
-                'title': item['title'],
-                'prog_slug': item['podcastSlug'],
-                'author': item['author'],
-                'pod_notes': item['pod_notes'],
-                'episode_notes': item['episode_notes'],
-                'published_date': item['published'].split('T')[0]
-            }
-            db.episodes.upsert(episode_data)
-    print(f"Added {i} new Pocketcasts URLs to queue")
-
-    # ----------- Add Youtube URLs -----------
+    return [(
+        PocketCast(
+            url=item['url'],
+            title=item['title'],
+            prog_slug=item['podcastSlug'],
+            author=item['author'],
+            pod_notes=item['pod_notes'],
+            episode_notes=item['episode_notes'],
+            published_date=item['published'].split('T')[0]
+        ),
+        {
+            'type': 'pocketcasts',
+            'url': item['url'],
+            'status': 'todo',
+            'title': item['title'],
+            'prog_slug': item['podcastSlug'],
+            'author': item['author'],
+            'pod_notes': item['pod_notes'],
+            'episode_notes': item['episode_notes'],
+            'published_date': item['published'].split('T')[0],
+            'duration': item.get('duration'),
+            'size': item.get('size')
+        }
+    ) for item in urls]
+
+def fetch_youtube():
+    """Fetch Youtube liked videos as (message, episode) pairs"""
     print("Fetching new Youtube liked video URLs...")
     yt_urls = get_youtube_liked_videos()
-    i = 0
-    for item in yt_urls:
-        if not db.episodes.find_one({'url': item['url']}):
+    return [(
+        Youtube(
+            url=item['url'],
+            title=item['title'],
+            prog_slug=item['prog_slug'],
+            published_date=item['published_date']
+        ),
+        {
+            'type': 'youtube',
+            'url': item['url'],
+            'status': 'todo',
+            'title': item['title'],
+            'prog_slug': item['prog_slug'],
+            'published_date': item['published_date']
+        }
+    ) for item in yt_urls]
+
+SOURCES = {
+    'pocketcasts': fetch_pocketcasts,
+    'youtube': fetch_youtube,
+}
+
+# Seconds to wait for each source before giving up on it for this pull
+SOURCE_TIMEOUTS = {
+    'pocketcasts': 180,
+    'youtube': 60,
+}
+
+def fetch_sources(sources=None):
+    """Fetch sources concurrently, returns {source: [(message, episode), ...]}
+
+    A source that fails or exceeds its timeout is left out of the result,
+    the other sources are still returned.
+    """
+    sources = list(SOURCES if sources is None else sources)
+    fetched = {}
+    if not sources:
+        return fetched
+
+    start = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=len(sources))
+    futures = {source: executor.submit(SOURCES[source]) for source in sources}
+    for source, future in futures.items():
+        timeout = float(os.getenv(f"PULL_TIMEOUT_{source.upper()}", SOURCE_TIMEOUTS.get(source, 120)))
+        try:
+            fetched[source] = future.result(timeout=max(0, start + timeout - time.perf_counter()))
+            print(f"Fetched {len(fetched[source])} {source} items in {time.perf_counter() - start:.2f}s")
+        except FutureTimeoutError:
+            print(f"Fetching {source} timed out after {timeout:.0f}s, skipping it this pull")
+        except Exception as e:
+            print(f"Fetching {source} failed: {e}")
+            traceback.print_exc()
+    # don't wait for timed out fetchers, their threads finish in the background
+    executor.shutdown(wait=False, cancel_futures=True)
+    return fetched
+
+def store_new_episodes(fetched):
+    """Insert episodes with unseen URLs in one write, returns their messages"""
+    all_messages = []
+    new_episodes = []
+
+    # Load known URLs once so deduplication is a set lookup per item
+    start = time.perf_counter()
+    known_urls = {ep['url'] for ep in db.episodes.find({}).fetch() if 'url' in ep}
+    print(f"Loaded {len(known_urls)} known URLs in {time.perf_counter() - start:.3f}s")
+
+    for source, items in fetched.items():
+        start = time.perf_counter()
+        i = 0
+        for message, episode_data in items:
+            if episode_data['url'] in known_urls:
+                continue
+            known_urls.add(episode_data['url'])
             i += 1
-            all_messages.append(Youtube(
-                url=item['url'],
-                title=item['title'],
-                prog_slug=item['prog_slug'],
-                published_date=item['published_date']
-            ))
-            episode_data = {
-                'type': 'youtube',
-                'url': item['url'],
-                'status': 'todo',
-                'title': item['title'],
-                'prog_slug': item['prog_slug'],
-                'published_date': item['published_date']
-            }
-            db.episodes.upsert(episode_data)
-
-    print(f"Added {i} new Youtube URLs to queue")
+            all_messages.append(message)
+            new_episodes.append(episode_data)
+        print(f"Found {i} new {source} URLs (dedupe {time.perf_counter() - start:.3f}s)")
+
+    if new_episodes:
+        start = time.perf_counter()
+        db.episodes.upsert(new_episodes)
+        print(f"Added {len(new_episodes)} new episodes to queue in {time.perf_counter() - start:.3f}s")
     return all_messages
 
+def pull_history(sources=None):
+    return store_new_episodes(fetch_sources(sources))
+
+def load_pull_schedules():
+    """Cron expression per source, e.g. PULL_SCHEDULE_YOUTUBE='*/30 * * * *'"""
+    return {
+        source: CronSchedule(os.getenv(f"PULL_SCHEDULE_{source.upper()}", os.getenv("PULL_SCHEDULE", "0 12 * * *")))
+        for source in SOURCES
+    }
+
+def load_last_runs():
+    return {
+        state['_id']: datetime.fromisoformat(state['last_run'])
+        for state in db.schedule.find({}).fetch() if state.get('last_run')
+    }
+
+def save_last_run(source, when):
+    db.schedule.upsert({'_id': source, 'last_run': when.isoformat()})
+
+def queue_episodes(mode, episodes):
+    """Mark episodes queued and, in sqs/file mode, send them to the queue like the web app's /update"""
+    now = datetime.now().isoformat()
+    for ep in episodes:
+        ep['status'] = 'queued'
+        ep['queued_at'] = now
+    db.episodes.upsert(episodes)
+    if mode in ('sqs', 'file'):
+        client, url = (sqs, queue_url) if mode == 'sqs' else (file_queue, FILE_QUEUE_PATH)
+        for ep in episodes:
+            client.send_message(QueueUrl=url, MessageBody=json.dumps(ep))
+    print(f"Queued {len(episodes)} episodes")
+
+async def offline_first_pull(mode):
+    """Pull the stub sources right away and queue every new episode, so an offline run starts working at once"""
+    now = datetime.now()
+    fetched = await asyncio.to_thread(fetch_sources)
+    store_new_episodes(fetched)
+    for source in fetched:
+        save_last_run(source, now)
+    queue_episodes(mode, db.episodes.find({'status': 'todo'}).fetch())
+
 async def producer(mode):
-    """Producer that fetches URLs and adds them to the queue"""
+    """Producer that pulls new episodes from each source on its cron schedule"""
     print("Starting producer...")
+    schedules = load_pull_schedules()
+    jitter = float(os.getenv("PULL_JITTER_SECONDS", 60))
+    started = datetime.now()
+    for source, schedule in schedules.items():
+        print(f"Pull schedule for {source}: {schedule.expr}")
 
     while True:
+        last_runs = load_last_runs()
         now = datetime.now()
-        print(f"{now.hour}:{now.minute}")
+        source, when = min(
+            ((source, next_run(schedule, last_runs.get(source), started)) for source, schedule in schedules.items()),
+            key=lambda pair: pair[1]
+        )
+        delay = max(0, (when - now).total_seconds())
+        if delay > 0:
+            # spread pulls a little so we don't hit the APIs at the same second every time
+            delay += random.uniform(0, jitter)
+        print(f"Next pull: {source} at {when} (in {delay:.0f}s)")
+        await asyncio.sleep(delay)
 
-        # Run at 12:00
-        if now.hour == 12 and now.minute == 0:
-            try:
-                all_messages = pull_history()
-            except Exception as e:
-                print(f"Error in producer: {e}")
+        now = datetime.now()
+        due = due_sources(schedules, load_last_runs(), started, now)
+        if not due:
+            # woke up early, e.g. the clock was adjusted: nothing is due yet
+            continue
+        try:
+            # network fetches run in a thread, db writes stay on the event loop
+            fetched = await asyncio.to_thread(fetch_sources, due)
+            store_new_episodes(fetched)
+            for source in fetched:
+                save_last_run(source, now)
+            if len(fetched) < len(due):
+                # failed sources stay due, retry them shortly
                 await asyncio.sleep(60)
+        except Exception as e:
+            print(f"Error in producer: {e}")
+            traceback.print_exc()
+            await asyncio.sleep(60)
 
-        await asyncio.sleep(60)
+def update_episode(id, **fields):
+    """Merge `fields` into the stored episode, re-reading it so concurrent UI edits are kept"""
+    item = db.episodes.find_one({'_id': id})
+    if not item:
+        raise Exception(f"Can not find episode: {id}")
+    item.update(fields)
+    db.episodes.upsert(item)
+    return item
 
 def move_to_status(id, status):
     try:
-        # Find the item by URL and update its status
-        item = db.episodes.find_one({'_id': id})
-        if not item:
-            raise Exception(f"Can not find episode: ")
-        item['status'] = status
-        db.episodes.upsert(item)
+        update_episode(id, status=status)
     except Exception as e:
         print(f"Error updating status for {id}: {e}")
 
 def move_to_processing(id):
     move_to_status(id, 'processing')
 
-def move_to_done(id):
-    move_to_status(id, 'done')
+async def sleep_or_stop(stopping, seconds):
+    """Sleep for `seconds`, waking up early if shutdown is requested"""
+    if stopping is None:
+        await asyncio.sleep(seconds)
+        return
+    try:
+        await asyncio.wait_for(stopping.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+        pass
+
+def is_stopping(stopping):
+    return stopping is not None and stopping.is_set()
+
+# ----------- Pipeline stages -----------
+
+def save_checkpoints(item):
+    update_episode(item['_id'], checkpoints=item.get('checkpoints', {}))
+
+def load_stored_progress(item):
+    """Pick up transcript and checkpoints saved by earlier attempts, e.g. for stale SQS message bodies"""
+    stored = db.episodes.find_one({'_id': item['_id']})
+    for field in ('transcript', 'segments', 'checkpoints'):
+        if stored and field in stored:
+            item[field] = stored[field]
+    return item
+
+async def transcribe_stage(item):
+    """Fetch captions or transcribe audio, reusing a stored transcript"""
+    item = load_stored_progress(item)
+    if "transcript" in item:
+        print(f"Using stored raw transcription {item['url']}: {item['transcript'][0:20]}")
+        return item
+
+    show_notes = ''
+    if item['type'] == 'pocketcasts':
+        missing = [field for field in ('pod_notes', 'episode_notes') if field not in item]
+        if missing:
+            raise MissingData(f"Episode {item['_id']} has no {', '.join(missing)}")
+        show_notes = f"Podcast title: {item['pod_notes']}\nShow notes: {item['episode_notes']}"
+
+    fetched = await get_caption_worker(item["url"], show_notes, item['type'], item.get('size'))
+    if fetched == None:
+        raise Exception(f"Failed to fetch raw transcription for {item['url']}")
+    result, segments = fetched
+
+    # timed segments live on the episode, the transcript cache may evict them
+    fields = {'transcript': result}
+    if segments:
+        fields['segments'] = transcript_segments.to_rows(segments)
+    update_episode(item['_id'], **fields)
+    item.update(fields)
+    print(f"Completed fetching raw transcription {item['url']}: {result[0:20]}")
+    return item
+
+async def format_stage(item):
+    """Format the transcript with the LLM, then extract toc and faq concurrently
+
+    Each step is checkpointed on the episode with a hash of its inputs, so a retry
+    only redoes the steps (and transcript chunks) that did not finish.
+    """
+    format_key = content_hash(item['transcript'], lm_provider, get_template())
+    formatted_result = get_checkpoint(item, 'format', format_key)
+    if formatted_result is None:
+        parts = get_checkpoint(item, 'format_parts', format_key, {})
+
+        def on_part(key, result):
+            set_checkpoint(item, 'format_parts', format_key, parts)
+            save_checkpoints(item)
+
+        formatted_result = await format_transcript(item['transcript'], cache=parts, on_part=on_part) # format using llm
+        set_checkpoint(item, 'format', format_key, formatted_result)
+        clear_checkpoint(item, 'format_parts')
+        save_checkpoints(item)
+    else:
+        print(f"Using checkpointed formatted transcript {item['url']}")
+
+    async def extract(stage, extractor):
+        key = content_hash(formatted_result, extractor.__name__)
+        result = get_checkpoint(item, stage, key)
+        if result is None:
+            result = await asyncio.to_thread(extractor, formatted_result)
+            set_checkpoint(item, stage, key, result)
+            save_checkpoints(item)
+        return result
+
+    toc, faq = await asyncio.gather(
+        extract('toc', extract_toc), # extract table of contents
+        extract('faq', extract_faq)  # extract faq
+    )
+    item['formatted'] = formatted_result
+    item['toc'] = toc
+    item['faq'] = faq
+    return item
+
+async def publish_stage(item):
+    blog_post = ''
+    content = format_pr_content(item['title'], item['url'], item['formatted'], blog_post, item['toc'], item['faq'])
+    key = content_hash(item['title'], item['published_date'], content)
+    pr_url = get_checkpoint(item, 'publish', key)
+    if pr_url:
+        print(f"PR already created: {pr_url}")
+    else:
+        pr_url, _ = await asyncio.to_thread(
+            create_branch_and_pr,
+            item["title"],
+            content,
+            item['published_date'],
+            item["prog_slug"] if 'prog_slug' in item else None
+        )
+        print(f"Created PR: {pr_url}")
+        set_checkpoint(item, 'publish', key, pr_url)
+        save_checkpoints(item)
+    item['pr_url'] = pr_url
+    update_episode(item['_id'], pr_url=pr_url)
+    return item
 
-def move_to_error(id):
-    move_to_status(id, 'error')
+@dataclass
+class PipelineConfig:
+    transcribe: int = 2
+    format: int = 6
+    publish: int = 2
 
-async def sqs_consumer(name):
-    print(f"Starting sqs consumer {name}...")
-    while True:
+def mark_stage(job, stage):
+    try:
+        update_episode(job.item['_id'], stage=stage)
+    except Exception as e:
+        print(f"Error updating stage for {job.item.get('_id')}: {e}")
+
+JOBS_IN_FLIGHT = REGISTRY.gauge('transcript_jobs_in_flight', 'Episodes currently in the pipeline')
+JOBS = REGISTRY.counter('transcript_jobs_total', 'Finished pipeline jobs by result (done, retry, error)')
+STAGE_SECONDS = REGISTRY.histogram('transcript_stage_seconds', 'Time spent in each pipeline stage')
+
+def measured(name, run):
+    """Stage run wrapped in a span and a latency histogram"""
+    run = traced(name)(run)
+
+    async def wrapper(item):
+        with STAGE_SECONDS.time(stage=name):
+            return await run(item)
+    return wrapper
+
+def create_pipeline(config):
+    return Pipeline([
+        Stage('transcribe', measured('transcribe', transcribe_stage), config.transcribe),
+        Stage('format', measured('format', format_stage), config.format),
+        Stage('publish', measured('publish', publish_stage), config.publish),
+    ], on_stage=mark_stage)
+
+def save_trace(job, trace, status):
+    summary = finish_trace(trace, status)
+    print(f"Trace {trace.id} for {job.item['url']}: {status} in {summary['duration']:.1f}s")
+    try:
+        update_episode(job.item['_id'], trace=summary)
+    except Exception as e:
+        print(f"Error saving trace for {job.item['_id']}: {e}")
+
+def traced_job(item, on_done, on_error, on_cancel, meta=None):
+    """Job whose stages all record spans on one trace, saved on the episode when it finishes"""
+    context = contextvars.copy_context()
+    trace = context.run(start_trace, item.get('title') or item['url'], episode=item['_id'], url=item['url'])
+    JOBS_IN_FLIGHT.inc()
+
+    def done(job):
+        JOBS_IN_FLIGHT.dec()
+        save_trace(job, trace, 'done')
+        return on_done(job)
+
+    def error(job, e):
+        JOBS_IN_FLIGHT.dec()
+        save_trace(job, trace, 'error')
+        return on_error(job, e)
+
+    def cancel(job):
+        JOBS_IN_FLIGHT.dec()
+        save_trace(job, trace, 'cancelled')
+        return on_cancel(job)
+
+    return Job(item, on_done=done, on_error=error, on_cancel=cancel, meta=meta or {}, context=context)
+
+# ----------- Consumers -----------
+
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', 5))
+RETRY_BASE_SECONDS = float(os.getenv('RETRY_BASE_SECONDS', 60))
+
+def schedule_retry(id, error):
+    """Record a failed attempt on the episode, returns the retry delay or None when giving up"""
+    stored = db.episodes.find_one({'_id': id}) or {}
+    state, delay = next_retry(stored.get('retry'), error, datetime.now(), RETRY_MAX_ATTEMPTS, RETRY_BASE_SECONDS)
+    JOBS.inc(result='error' if delay is None else 'retry')
+    try:
+        if delay is None:
+            print(f"Giving up on {id} after {state['attempts']} attempts: {state['error_class']}")
+            update_episode(id, status='error', retry=state)
+        else:
+            print(f"Retrying {id} in {delay:.0f}s (attempt {state['attempts']}): {state['error_class']}")
+            update_episode(id, status='retry', retry=state)
+    except Exception as e:
+        print(f"Error scheduling retry for {id}: {e}")
+    return delay
+
+def complete_episode(id):
+    JOBS.inc(result='done')
+    try:
+        update_episode(id, status='done', retry=None)
+    except Exception as e:
+        print(f"Error updating status for {id}: {e}")
+
+def local_job_done(job):
+    print(f"Completed {job.item['url']}")
+    complete_episode(job.item["_id"])
+
+def local_job_error(job, error):
+    # retry_releaser puts the episode back to queued when its retry is due
+    schedule_retry(job.item["_id"], error)
+
+def local_job_cancelled(job):
+    # cut off by a shutdown, the next start picks it up again from its checkpoints
+    print(f"Re-queueing unfinished {job.item['url']}")
+    move_to_status(job.item["_id"], 'queued')
+
+async def retry_releaser(stopping):
+    """Delay queue for local mode: re-queues episodes whose next attempt is due"""
+    print("Starting retry releaser...")
+    while not stopping.is_set():
+        try:
+            now = datetime.now()
+            next_due = None
+            for item in db.episodes.find({'status': 'retry'}).fetch():
+                due_at = datetime.fromisoformat((item.get('retry') or {}).get('next_attempt_at', now.isoformat()))
+                if due_at <= now:
+                    print(f"Re-queueing {item['url']} for attempt {item['retry']['attempts'] + 1}")
+                    update_episode(item['_id'], status='queued', queued_at=now.isoformat())
+                elif next_due is None or due_at < next_due:
+                    next_due = due_at
+            # also wake up periodically to see retries scheduled by other processes
+            delay = 60 if next_due is None else min(60, (next_due - now).total_seconds())
+        except Exception as e:
+            print(f"Error in retry releaser: {e}")
+            delay = 60
+        await sleep_or_stop(stopping, max(1, delay))
+
+async def sqs_consumer(name, stopping=None, pipeline=None, queue=None):
+    """Consumer that receives SQS messages in batches and feeds them into the pipeline"""
+    print(f"Starting {'file' if queue.client is file_queue else 'sqs'} consumer {name}...")
+
+    def sqs_job_done(job):
+        job.meta['heartbeat'].stop()
+        queue.ack(job.meta['receipt_handle'])
+        complete_episode(job.item["_id"])
+
+    async def sqs_job_error(job, error):
+        job.meta['heartbeat'].stop()
+        delay = schedule_retry(job.item["_id"], error)
+        if delay is None:
+            queue.ack(job.meta['receipt_handle'])
+        else:
+            # the queue is the delay queue: the message becomes visible again when due
+            await queue.release(job.meta['receipt_handle'], int(delay))
+
+    async def sqs_job_cancelled(job):
+        # cut off by a shutdown: make the message visible to other workers right away
+        job.meta['heartbeat'].stop()
+        print(f"Re-queueing unfinished {job.item['url']}")
+        move_to_status(job.item["_id"], 'queued')
+        await queue.release(job.meta['receipt_handle'])
+
+    async def submit_batch(messages):
+        """Submit messages in order, each into one of the pipeline slots reserved for the batch and
+        with its heartbeat started once the pipeline has taken its job; messages left unsubmitted
+        (error or cancellation) give their slot back and are made visible to other workers again"""
+        pending = list(messages)
+        reserved = len(messages)
+        bodies = {}
+        job = None
         try:
-            response = sqs.receive_message(
-                QueueUrl=queue_url,
-                MaxNumberOfMessages=1,
-                WaitTimeSeconds=2,
-            )
-            messages = response.get('Messages', [])
-            message = messages[0] if messages else None
-            if not message:
-                print(f"Consumer {name}: No messages to process, sleeping...")
-                await asyncio.sleep(10)
-            else:
-                print(message['Body'])
-                item = json.loads(message['Body'])
+            for message in messages:
+                bodies[message['MessageId']] = json.loads(message['Body'])
+            # submit the cheapest / highest priority episodes of the batch first
+            pending.sort(key=lambda message: sort_key(bodies[message['MessageId']], datetime.now()))
+            while pending:
+                message = pending[0]
+                item = bodies[message['MessageId']]
                 move_to_processing(item["_id"])
-                print(f"Consumer {name}: Processing message {item}")
+                print(f"Consumer {name}: Processing message {item['_id']} {item['url']}")
+                job = traced_job(
+                    item,
+                    on_done=sqs_job_done,
+                    on_error=sqs_job_error,
+                    on_cancel=sqs_job_cancelled,
+                    meta={'receipt_handle': message['ReceiptHandle']}
+                )
+                reserved -= 1
+                await pipeline.submit(job, reserved=True)
+                # keep the message invisible until its job finishes
+                job.meta['heartbeat'] = queue.heartbeat(message['ReceiptHandle'])
+                pending.pop(0)
+                job = None
+        finally:
+            pipeline.release(reserved)
+            if job is not None:
+                # created but never accepted by the pipeline
+                JOBS_IN_FLIGHT.dec()
+            for message in pending:
                 try:
-                    show_notes = ''
-                    if item['type'] == 'pocketcasts':
-                        show_notes = f"Podcast title: {item['pod_notes']}\nShow notes: {item['episode_notes']}"
-
-                    result = await get_caption_worker(item["url"], show_notes, item['type'])
-                    if result == None:
-                        move_to_error(item["_id"])
-                        raise Exception(f"Failed to fetch raw transcription for {item['url']}")
-
-                    formatted_result = await format_transcript(result) # format using llm
-                    blog_post = ''
-                    toc = extract_toc(formatted_result) # extract table of contents
-                    faq = extract_faq(formatted_result) # extract faq
-                    pr_url, _ = create_branch_and_pr(
-                        item["title"],
-                        format_pr_content(item['title'], item['url'], formatted_result, blog_post, toc, faq),
-                        item['published_date'],
-                        item["prog_slug"] if 'prog_slug' in item else None
-                    )
-                    print(f"Consumer {name}: Created PR: {pr_url}")
-
-                    sqs.delete_message(
-                        QueueUrl=queue_url,
-                        ReceiptHandle=message['ReceiptHandle']
-                    )
-                    move_to_done(item["_id"])
-                except ParseError as e:
-                    print(f"Excepted no element found in xml.etree.ElementTree.ParseError: {e}")
-                    print(f"SQS message will be visibile after 30 minutes.")
-                    continue
+                    if message['MessageId'] in bodies:
+                        update_episode(bodies[message['MessageId']]['_id'], status='queued')
+                    await queue.release(message['ReceiptHandle'])
+                except Exception as e:
+                    print(f"Consumer {name}: failed to release message {message['MessageId']}: {e}")
+
+    while not is_stopping(stopping):
+        try:
+            # only take what the pipeline can start on, the rest stays available to other workers;
+            # slots are reserved before receiving, so consumers sharing the pipeline can't all
+            # count the same free slots and receive messages that would wait without a heartbeat
+            reserved = pipeline.reserve(MAX_BATCH)
+            if not reserved:
+                await sleep_or_stop(stopping, 1)
+                continue
+            messages = []
+            try:
+                messages = await queue.receive(reserved)
+            finally:
+                # keep one slot per received message for submit_batch
+                pipeline.release(reserved - len(messages))
+            if not messages:
+                print(f"Consumer {name}: No messages to process")
+                continue
+            await submit_batch(messages)
         except Exception as e:
             print(f"Consumer {name}: error: {e}")
             traceback.print_exc()
-            if 'item' in dir() and item:
-                move_to_error(item["_id"])
-            await asyncio.sleep(60)
+            await sleep_or_stop(stopping, 60)
+    print(f"Consumer {name}: stopped")
 
 
-async def local_consumer(name):
-    """Consumer that processes URLs from the queue"""
+async def local_consumer(name, stopping=None, pipeline=None, queue=None):
+    """Consumer that claims queued episodes and feeds them into the pipeline"""
     print(f"Starting local consumer {name}...")
 
-    while True:
+    while not is_stopping(stopping):
         try:
-            # FIXME: Race condition: the other consumer could grab the same item
-            item = db.episodes.find_one({ 'status': 'queued' })
+            # Consumers in the same process never interleave between find and claim
+            item = pick_next(db.episodes.find({ 'status': 'queued' }).fetch())
             if not item:
                 print(f"Consumer {name}: No URLs to process, sleeping...")
-                await asyncio.sleep(60)
+                await sleep_or_stop(stopping, 60)
                 continue
 
             move_to_processing(item["_id"])
 
             print(f"Consumer {name}: Processing {item['url']}")
+            job = traced_job(item, on_done=local_job_done, on_error=local_job_error, on_cancel=local_job_cancelled)
             try:
-                if "transcript" not in item:
-                    show_notes = ''
-                    if item['type'] == 'pocketcasts':
-                        show_notes = f"Podcast title: {item['pod_notes']}\nShow notes: {item['episode_notes']}"
-
-                    result = await get_caption_worker(item["url"], show_notes, item['type'])
-                    if result == None:
-                        move_to_error(item["_id"])
-                        raise Exception(f"Failed to fetch raw transcription for {item['url']}")
-                    else:
-                        # Update the item with transcript
-                        item = db.episodes.find_one({'url': item['url']})
-                        item['transcript'] = result
-                        db.episodes.upsert(item)
-                        print(f"Consumer: Completed fetching raw transcription {item['url']}: {result[0:20]}")
-                else:
-                    result = item["transcript"]
-                    print(f"Consumer {name}: Fetching raw transcription from json {item['url']}: {result[0:20]}")
-
-                formatted_result = await format_transcript(result) # format using llm
-                blog_post = ''
-                toc = extract_toc(formatted_result) # extract table of contents
-                faq = extract_faq(formatted_result) # extract faq
-                pr_url, _ = create_branch_and_pr(
-                    item["title"],
-                    format_pr_content(item['title'], item['url'], formatted_result, blog_post, toc, faq),
-                    item['published_date'],
-                    item["prog_slug"] if 'prog_slug' in item else None
-                )
-                print(f"Consumer {name}: Created PR: {pr_url}")
-
-                move_to_done(item["_id"])
-
-            except Exception as e:
-                print(f"Consumer {name}: Error processing {item['url']}: {e}")
-                traceback.print_exc()
-                # mark error and skip, e.g. yt fail to download subtitle
-                move_to_error(item["_id"])
-                await asyncio.sleep(60)
+                await pipeline.submit(job)
+            except BaseException:
+                # cancelled by a drain while waiting for room, the pipeline never took it
+                JOBS_IN_FLIGHT.dec()
+                move_to_status(item["_id"], 'queued')
+                raise
 
         except Exception as e:
             print(f"Consumer {name}: error: {e}")
-            await asyncio.sleep(60)
+            await sleep_or_stop(stopping, 60)
+    print(f"Consumer {name}: stopped")
 
-async def main(mode='local'):
-    print('Mode: ', mode)
+async def supervise(name, consumer, stopping):
+    """Run a consumer coroutine, restarting it with backoff whenever it crashes"""
+    restarts = 0
+    while not stopping.is_set():
+        try:
+            await consumer(name, stopping)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            restarts += 1
+            delay = min(60, 2 ** restarts)
+            print(f"Consumer {name}: crashed ({e}), restart #{restarts} in {delay}s")
+            traceback.print_exc()
+            await sleep_or_stop(stopping, delay)
+
+def install_signal_handlers(stopping):
+    """Request a graceful drain on SIGINT/SIGTERM"""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except (NotImplementedError, RuntimeError, ValueError):
+            # not supported on this platform or not in the main thread
+            pass
+
+async def drain(tasks, pipeline, queue, timeout):
+    """Stop intake, let in-flight jobs finish, cancel whatever is left after `timeout` seconds"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    try:
+        await asyncio.wait_for(pipeline.join(), timeout=max(0, deadline - loop.time()))
+    except asyncio.TimeoutError:
+        print(f"{pipeline.in_flight} jobs did not finish within {timeout}s, cancelling")
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await pipeline.close()
+    if queue:
+        await queue.close()
+    REGISTRY.remove_dump()
+
+METRICS_DUMP_INTERVAL = float(os.getenv('METRICS_DUMP_INTERVAL', 15))
+
+async def dump_metrics(stopping):
+    """Write this process's metrics for the web app's /metrics endpoint"""
+    while not stopping.is_set():
+        try:
+            await asyncio.to_thread(REGISTRY.dump)
+        except Exception as e:
+            print(f"Error writing metrics: {e}")
+        await sleep_or_stop(stopping, METRICS_DUMP_INTERVAL)
+
+def create_queue(mode):
+    visibility_timeout = int(os.getenv('SQS_VISIBILITY_TIMEOUT', 900))
+    if mode == 'sqs':
+        return SqsWorker(sqs, queue_url, visibility_timeout=visibility_timeout)
+    if mode == 'file':
+        # same consumer path as SQS, backed by a local SQLite file
+        return SqsWorker(file_queue, FILE_QUEUE_PATH, visibility_timeout=visibility_timeout)
+    return None
+
+async def start_workers(mode, workers, prefix, stopping, config, processes=1):
+    """Start the stage pipeline and `workers` supervised consumers feeding it
+
+    `processes` is how many processes run consumers in total, they share the CPU for local whisper.
+    """
+    share_cpu(processes)
+    pipeline = create_pipeline(config)
+    pipeline.start()
+    queue = create_queue(mode)
+    if queue:
+        queue.start()
+    consumer = local_consumer if mode == 'local' else sqs_consumer
+
+    def run(name, stopping):
+        return consumer(name, stopping, pipeline, queue)
+
+    tasks = [asyncio.create_task(supervise(f"{prefix}{i + 1}", run, stopping)) for i in range(workers)]
+    tasks.append(asyncio.create_task(dump_metrics(stopping)))
+    tasks.append(asyncio.create_task(warm_up()))
+    return tasks, pipeline, queue
+
+def worker_process(mode, workers, index, drain_timeout, config, processes):
+    """Entry point of a worker process: runs `workers` consumers until SIGTERM"""
+    async def run():
+        stopping = asyncio.Event()
+        install_signal_handlers(stopping)
+        tasks, pipeline, queue = await start_workers(mode, workers, f"p{index}-", stopping, config, processes)
+        await stopping.wait()
+        await drain(tasks, pipeline, queue, drain_timeout)
+
+    asyncio.run(run())
+
+def start_worker_process(mode, workers, index, drain_timeout, config, processes):
+    proc = multiprocessing.Process(
+        target=worker_process,
+        args=(mode, workers, index, drain_timeout, config, processes),
+        name=f"transcript-worker-{index}",
+        daemon=False
+    )
+    proc.start()
+    print(f"Started worker process {index} (pid {proc.pid})")
+    return proc
+
+async def supervise_processes(procs, mode, workers, drain_timeout, config, stopping):
+    """Restart worker processes that exit while we are not shutting down"""
+    while not stopping.is_set():
+        for index, proc in enumerate(procs):
+            if not proc.is_alive() and not stopping.is_set():
+                print(f"Worker process {index} (pid {proc.pid}) exited with {proc.exitcode}, restarting...")
+                # the main process runs consumers too
+                procs[index] = start_worker_process(mode, workers, index, drain_timeout, config, len(procs) + 1)
+        await sleep_or_stop(stopping, 5)
+
+async def stop_processes(procs, timeout):
+    for proc in procs:
+        if proc.is_alive():
+            proc.terminate()  # SIGTERM: the worker drains its consumers
+    for proc in procs:
+        await asyncio.to_thread(proc.join, timeout)
+        if proc.is_alive():
+            print(f"Worker process {proc.pid} did not drain within {timeout}s, killing")
+            proc.kill()
+
+async def main(mode='local', workers=2, processes=0, drain_timeout=600, config=None):
+    config = config or PipelineConfig()
+    print('Mode: ', mode, 'workers: ', workers, 'processes: ', processes)
+
+    if mode == 'local' and processes > 0:
+        print("Warning: local mode claims episodes without locking, worker processes may pick the same episode, use --mode file")
+
+    stopping = asyncio.Event()
+    install_signal_handlers(stopping)
+
+    if OFFLINE:
+        # before any consumer starts, so none of them finds an empty queue and goes to sleep
+        try:
+            await offline_first_pull(mode)
+        except Exception as e:
+            print(f"Error in offline first pull: {e}")
+            traceback.print_exc()
 
+    # the main process runs consumers too, all of them share the CPU
+    procs = [start_worker_process(mode, workers, i, drain_timeout, config, processes + 1) for i in range(processes)]
     producer_task = asyncio.create_task(producer(mode))
-    consumer_task1 = asyncio.create_task(local_consumer(1) if mode == 'local' else sqs_consumer(1))
-    consumer_task2 = asyncio.create_task(local_consumer(2) if mode == 'local' else sqs_consumer(2))
+    process_task = asyncio.create_task(supervise_processes(procs, mode, workers, drain_timeout, config, stopping))
+    consumer_tasks, pipeline, queue = await start_workers(mode, workers, '', stopping, config, processes + 1)
+    retry_task = asyncio.create_task(retry_releaser(stopping)) if mode == 'local' else None
 
     try:
-        await asyncio.gather(producer_task, consumer_task1, consumer_task2)
-    except asyncio.CancelledError:
+        await stopping.wait()
+        print("Draining consumers...")
+    finally:
+        stopping.set()
         producer_task.cancel()
-        consumer_task1.cancel()
-        consumer_task2.cancel()
-        await asyncio.gather(producer_task, consumer_task1, consumer_task2, return_exceptions=True)
+        await asyncio.gather(producer_task, process_task, return_exceptions=True)
+        await drain(consumer_tasks, pipeline, queue, drain_timeout)
+        if retry_task:
+            await retry_task
+        await stop_processes(procs, drain_timeout)
 
 if __name__ == "__main__":
     try:
         parser = argparse.ArgumentParser(description="Transcript Queue")
-        parser.add_argument("--mode", choices=["local", "sqs"], default='local', help="local queue or SQS queue")
+        parser.add_argument("--mode", choices=["local", "sqs", "file"], default='local', help="local queue, SQS queue or SQLite file queue")
+        parser.add_argument("--workers", type=int, default=2, help="number of consumer coroutines per process")
+        parser.add_argument("--processes", type=int, default=0, help="number of extra worker processes, each running --workers consumers")
+        parser.add_argument("--drain-timeout", type=int, default=600, help="seconds to let in-flight jobs finish on shutdown")
+        parser.add_argument("--transcribe-concurrency", type=int, default=2, help="episodes fetching captions or transcribing at once")
+        parser.add_argument("--format-concurrency", type=int, default=6, help="episodes in LLM formatting at once")
+        parser.add_argument("--offline", action="store_true", help="replace LLM, whisper, YouTube, Pocket Casts, SQS and GitHub with local stubs")
+        parser.add_argument("--publish-concurrency", type=int, default=2, help="episodes publishing GitHub PRs at once")
         args = parser.parse_args()
 
-        asyncio.run(main(mode=args.mode))
+        config = PipelineConfig(
+            transcribe=args.transcribe_concurrency,
+            format=args.format_concurrency,
+            publish=args.publish_concurrency
+        )
+        asyncio.run(main(mode=args.mode, workers=args.workers, processes=args.processes, drain_timeout=args.drain_timeout, config=config))
     except KeyboardInterrupt:
         print("Shutting down job queue...")
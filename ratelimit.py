@@ -0,0 +1,185 @@
+import asyncio
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+RATE_LIMIT_PATH = os.getenv('RATE_LIMIT_PATH', './data/ratelimit.sqlite3')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    requests REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    paused_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+@dataclass
+class Limit:
+    """Budget per minute, None means unlimited"""
+    rpm: Optional[float] = None
+    tpm: Optional[float] = None
+
+
+# Conservative defaults, override with LLM_RPM_<PROVIDER> / LLM_TPM_<PROVIDER>
+DEFAULT_LIMITS: Dict[str, Limit] = {
+    'openai': Limit(rpm=500, tpm=200_000),
+    'google': Limit(rpm=150, tpm=1_000_000),
+    # self-hosted, only bounded by format concurrency
+    'ollama': Limit(),
+    'basement': Limit(),
+}
+
+
+def load_limit(provider: str) -> Limit:
+    default = DEFAULT_LIMITS.get(provider, Limit())
+    rpm = os.getenv(f'LLM_RPM_{provider.upper()}')
+    tpm = os.getenv(f'LLM_TPM_{provider.upper()}')
+    return Limit(
+        rpm=float(rpm) if rpm else default.rpm,
+        tpm=float(tpm) if tpm else default.tpm,
+    )
+
+
+def estimate_tokens(text: str, output_ratio: float = 1.0) -> int:
+    """Rough prompt + completion token count, ~4 chars per token for English
+    (CJK is closer to 1 char per token, so this errs low for Chinese transcripts)"""
+    prompt = len(text) / 4
+    return int(prompt * (1 + output_ratio)) + 1
+
+
+def is_rate_limited(error: Optional[BaseException]) -> bool:
+    """429 / quota errors from the OpenAI and Gemini clients, also when wrapped by another exception"""
+    while error is not None:
+        if type(error).__name__ == 'RateLimitError' or 'RESOURCE_EXHAUSTED' in str(error):
+            return True
+        for attr in ('status_code', 'code', 'status'):
+            if getattr(error, attr, None) in (429, 'RESOURCE_EXHAUSTED'):
+                return True
+        error = error.__cause__
+    return False
+
+
+def retry_after(error: Exception, default: float) -> float:
+    error = error.__cause__ or error
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after', default))
+    except (TypeError, ValueError):
+        return default
+
+
+class RateLimiter:
+    """Token buckets for requests and tokens per minute, keyed by provider/model
+
+    Bucket state lives in a SQLite file so every consumer and worker process on the
+    box draws from the same budget. Callers wait for capacity instead of failing,
+    and a 429 pauses the whole bucket.
+    """
+
+    def __init__(self, path: Optional[str] = None, limits: Optional[Dict[str, Limit]] = None):
+        self.path = path or RATE_LIMIT_PATH
+        self.limits = limits
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            yield conn
+        finally:
+            conn.close()
+
+    def limit(self, provider: str) -> Limit:
+        if self.limits is not None:
+            return self.limits.get(provider, Limit())
+        return load_limit(provider)
+
+    def try_acquire(self, provider: str, model: str, tokens: int = 0) -> float:
+        """Take one request and `tokens` from the bucket, returns 0 or the seconds to wait before trying again"""
+        limit = self.limit(provider)
+        if limit.rpm is None and limit.tpm is None:
+            return 0
+        rpm = limit.rpm or float('inf')
+        tpm = limit.tpm or float('inf')
+        # a single call larger than the whole budget would never fit
+        tokens = min(tokens, tpm)
+        key = f'{provider}/{model}'
+
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                row = conn.execute('SELECT requests, tokens, updated_at, paused_until FROM buckets WHERE key = ?', (key,)).fetchone()
+                if row is None:
+                    requests_left, tokens_left, paused_until = rpm, tpm, 0
+                else:
+                    elapsed = max(0, now - row[2])
+                    requests_left = min(rpm, row[0] + elapsed * rpm / 60)
+                    tokens_left = min(tpm, row[1] + elapsed * tpm / 60)
+                    paused_until = row[3]
+
+                if paused_until > now:
+                    wait = paused_until - now
+                elif requests_left >= 1 and tokens_left >= tokens:
+                    requests_left -= 1
+                    tokens_left -= tokens
+                    wait = 0
+                else:
+                    wait = max((1 - requests_left) * 60 / rpm, (tokens - tokens_left) * 60 / tpm)
+
+                conn.execute(
+                    'INSERT OR REPLACE INTO buckets (key, requests, tokens, updated_at, paused_until) VALUES (?, ?, ?, ?, ?)',
+                    (key, requests_left, tokens_left, now, paused_until)
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return wait
+
+    def settle(self, provider: str, model: str, estimated: int, actual: int):
+        """Correct the token bucket once the response reports real usage"""
+        limit = self.limit(provider)
+        if not limit.tpm or not actual:
+            return
+        with self._connection() as conn:
+            conn.execute(
+                'UPDATE buckets SET tokens = MIN(?, tokens + ?) WHERE key = ?',
+                (limit.tpm, min(estimated, limit.tpm) - actual, f'{provider}/{model}')
+            )
+
+    def pause(self, provider: str, model: str, seconds: float):
+        """Stop handing out requests for a bucket after the provider returned 429"""
+        key = f'{provider}/{model}'
+        until = time.time() + seconds
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT INTO buckets (key, requests, tokens, updated_at, paused_until) VALUES (?, 0, 0, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET requests = 0, paused_until = MAX(paused_until, excluded.paused_until)',
+                (key, time.time(), until)
+            )
+
+    async def acquire(self, provider: str, model: str, tokens: int = 0):
+        while True:
+            wait = await asyncio.to_thread(self.try_acquire, provider, model, tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, provider: str, model: str, tokens: int = 0):
+        while True:
+            wait = self.try_acquire(provider, model, tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
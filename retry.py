@@ -0,0 +1,49 @@
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+
+class MissingData(Exception):
+    """Captions or episode fields that are not there, another attempt won't find them either"""
+
+
+# Errors that will fail the same way on every attempt, e.g. a video without captions
+PERMANENT_ERRORS = {
+    'TranscriptsDisabled',
+    'NoTranscriptFound',
+    'VideoUnavailable',
+    'InvalidVideoId',
+    'MissingData',
+}
+
+
+def error_class(error: Exception) -> str:
+    return type(error).__name__
+
+
+def is_transient(error: Exception) -> bool:
+    return error_class(error) not in PERMANENT_ERRORS
+
+
+def backoff_delay(attempt: int, base: float = 60, cap: float = 6 * 3600, jitter: float = 0.2) -> float:
+    """Exponential backoff for the `attempt`-th failure (1-based), +/- `jitter` fraction"""
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay * random.uniform(1 - jitter, 1 + jitter)
+
+
+def next_retry(state: Optional[dict], error: Exception, now: datetime,
+               max_attempts: int = 5, base: float = 60, cap: float = 6 * 3600):
+    """Record a failed attempt, returns (retry state, delay in seconds or None when giving up)"""
+    attempts = (state or {}).get('attempts', 0) + 1
+    state = {
+        'attempts': attempts,
+        'error_class': error_class(error),
+        'last_error': str(error)[:500],
+        'failed_at': now.isoformat(),
+    }
+    if not is_transient(error) or attempts >= max_attempts:
+        return state, None
+
+    delay = backoff_delay(attempts, base, cap)
+    state['next_attempt_at'] = (now + timedelta(seconds=delay)).isoformat()
+    return state, delay
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+ALIASES = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+
+# (name, min, max) of the five cron fields
+FIELDS = [
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day', 1, 31),
+    ('month', 1, 12),
+    # 7 is Sunday as well, folded into 0 once ranges and steps are expanded
+    ('weekday', 0, 7),
+]
+
+
+def parse_field(spec: str, low: int, high: int) -> Set[int]:
+    """Parse one cron field: `*`, `5`, `1-5`, `*/15`, `10-40/10` and comma separated lists"""
+    values = set()
+    for part in spec.split(','):
+        step = 1
+        if '/' in part:
+            part, step_spec = part.split('/', 1)
+            step = int(step_spec)
+            if step < 1:
+                raise ValueError(f"Bad cron step: {spec}")
+
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(v) for v in part.split('-', 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron field out of range [{low}-{high}]: {spec}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """A standard five field cron expression (minute hour day month weekday)
+
+    Weekday 0 is Sunday (7 is accepted too). As in cron, when both day and weekday
+    are restricted a time matches if either of them matches.
+    """
+
+    def __init__(self, expr: str):
+        self.expr = expr.strip()
+        fields = ALIASES.get(self.expr, self.expr).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expr}")
+
+        parsed = [parse_field(spec, low, high) for spec, (_, low, high) in zip(fields, FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {v % 7 for v in weekdays}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def __repr__(self):
+        return f"CronSchedule({self.expr!r})"
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day_ok = dt.day in self.days
+        # datetime.weekday() is 0 for Monday, cron uses 0 for Sunday
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return weekday_ok
+        if self.any_weekday:
+            return day_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, after: datetime) -> datetime:
+        """First matching minute strictly after `after`"""
+        dt = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+                continue
+            if dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+                continue
+            return dt
+        raise ValueError(f"Cron expression never matches: {self.expr}")
+
+
+def next_run(schedule: CronSchedule, last_run: Optional[datetime], started: datetime) -> datetime:
+    """When a source is due next
+
+    Runs missed since `last_run` (e.g. the process was down at the scheduled time)
+    collapse into a single catch-up run that is due immediately.
+    """
+    return schedule.next_after(last_run or started)
+
+
+def due_sources(schedules: dict, last_runs: dict, started: datetime, now: datetime) -> List[str]:
+    return [source for source, schedule in schedules.items()
+            if next_run(schedule, last_runs.get(source), started) <= now]
@@ -0,0 +1,82 @@
+import json
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from audio import to_original_time
+
+
+@dataclass
+class Segment:
+    """A stretch of transcript, times in seconds from the start of the episode"""
+    start: float
+    end: float
+    text: str
+    avg_logprob: Optional[float] = None
+
+
+def from_whisper_cpp(data: Dict) -> List[Segment]:
+    """Segments from whisper-cli `-ojf` output (offsets in ms, tokens with probabilities)"""
+    segments = []
+    for item in data.get('transcription', []):
+        probabilities = [
+            token['p'] for token in item.get('tokens', [])
+            # special tokens like [_BEG_] and [_TT_150] carry no text
+            if not token.get('text', '').startswith('[_') and token.get('p', 0) > 0
+        ]
+        segments.append(Segment(
+            start=item['offsets']['from'] / 1000,
+            end=item['offsets']['to'] / 1000,
+            text=item['text'].strip(),
+            avg_logprob=sum(math.log(p) for p in probabilities) / len(probabilities) if probabilities else None,
+        ))
+    return segments
+
+
+def from_verbose_json(items: Iterable) -> List[Segment]:
+    """Segments from a `verbose_json` response, the OpenAI API's objects or whisper-server's dicts"""
+    segments = []
+    for item in items or []:
+        get = item.get if isinstance(item, dict) else lambda name, default=None: getattr(item, name, default)
+        segments.append(Segment(
+            start=float(get('start')),
+            end=float(get('end')),
+            text=get('text', '').strip(),
+            avg_logprob=get('avg_logprob'),
+        ))
+    return segments
+
+
+def shift(segments: List[Segment], offset: float) -> List[Segment]:
+    """Move segments of a part that starts `offset` seconds into the audio"""
+    return [Segment(s.start + offset, s.end + offset, s.text, s.avg_logprob) for s in segments]
+
+
+def to_original(segments: List[Segment], kept: Optional[List[Tuple[float, float]]]) -> List[Segment]:
+    """Map times in audio trimmed to the `kept` ranges (see whisper.find_sound) back to the episode"""
+    if not kept:
+        return segments
+    return [
+        Segment(to_original_time(kept, s.start), to_original_time(kept, s.end), s.text, s.avg_logprob)
+        for s in segments
+    ]
+
+
+def to_rows(segments: List[Segment]) -> List[List]:
+    """Compact form stored on the episode: one [start, end, avg_logprob, text] row per segment, times in ms"""
+    return [
+        [round(s.start * 1000), round(s.end * 1000), None if s.avg_logprob is None else round(s.avg_logprob, 3), s.text]
+        for s in segments
+    ]
+
+
+def from_rows(rows: List[List]) -> List[Segment]:
+    return [Segment(start / 1000, end / 1000, text, logprob) for start, end, logprob, text in rows]
+
+
+def dumps(segments: List[Segment]) -> str:
+    return json.dumps(to_rows(segments), ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(data: str) -> List[Segment]:
+    return from_rows(json.loads(data))
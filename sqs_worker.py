@@ -0,0 +1,122 @@
+import asyncio
+import traceback
+from typing import Dict, List, Optional, Set
+
+MAX_BATCH = 10  # SQS limit for receive and batch delete
+
+
+class Heartbeat:
+    """Keeps a received message invisible while its job is running"""
+
+    def __init__(self, client, queue_url: str, receipt_handle: str, visibility_timeout: int):
+        self.client = client
+        self.queue_url = queue_url
+        self.receipt_handle = receipt_handle
+        self.visibility_timeout = visibility_timeout
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+        return self
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def _run(self):
+        # extend well before the current timeout runs out
+        interval = max(1, self.visibility_timeout / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(
+                    self.client.change_message_visibility,
+                    QueueUrl=self.queue_url,
+                    ReceiptHandle=self.receipt_handle,
+                    VisibilityTimeout=self.visibility_timeout
+                )
+            except Exception as e:
+                print(f"Failed to extend visibility of {self.receipt_handle[:16]}...: {e}")
+
+
+class SqsWorker:
+    """Non-blocking wrapper around an SQS client (or anything with the same API)
+
+    Receives up to 10 messages per long poll in a thread, extends visibility of
+    in-flight messages with heartbeats and deletes finished messages in batches.
+    """
+
+    def __init__(self, client, queue_url: str, visibility_timeout: int = 900,
+                 wait_seconds: int = 20, flush_interval: float = 2):
+        self.client = client
+        self.queue_url = queue_url
+        self.visibility_timeout = visibility_timeout
+        self.wait_seconds = wait_seconds
+        self.flush_interval = flush_interval
+        self.pending_deletes: List[str] = []
+        self.flush_task: Optional[asyncio.Task] = None
+        self.flushing: Set[asyncio.Task] = set()
+
+    def start(self):
+        self.flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def close(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            await asyncio.gather(self.flush_task, return_exceptions=True)
+            self.flush_task = None
+        await asyncio.gather(*self.flushing, return_exceptions=True)
+        await self.flush()
+
+    async def receive(self, max_messages: int = MAX_BATCH) -> List[Dict]:
+        response = await asyncio.to_thread(
+            self.client.receive_message,
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_messages, MAX_BATCH),
+            WaitTimeSeconds=self.wait_seconds,
+            VisibilityTimeout=self.visibility_timeout,
+        )
+        return response.get('Messages', [])
+
+    def heartbeat(self, receipt_handle: str) -> Heartbeat:
+        return Heartbeat(self.client, self.queue_url, receipt_handle, self.visibility_timeout).start()
+
+    def ack(self, receipt_handle: str):
+        """Schedule a processed message for deletion"""
+        self.pending_deletes.append(receipt_handle)
+        if len(self.pending_deletes) >= MAX_BATCH:
+            task = asyncio.create_task(self.flush())
+            self.flushing.add(task)
+            task.add_done_callback(self.flushing.discard)
+
+    async def release(self, receipt_handle: str, delay: int = 0):
+        """Make a message visible again after `delay` seconds"""
+        await asyncio.to_thread(
+            self.client.change_message_visibility,
+            QueueUrl=self.queue_url,
+            ReceiptHandle=receipt_handle,
+            VisibilityTimeout=delay
+        )
+
+    async def flush(self):
+        while self.pending_deletes:
+            batch = self.pending_deletes[:MAX_BATCH]
+            self.pending_deletes = self.pending_deletes[MAX_BATCH:]
+            entries = [{'Id': str(i), 'ReceiptHandle': handle} for i, handle in enumerate(batch)]
+            try:
+                response = await asyncio.to_thread(
+                    self.client.delete_message_batch,
+                    QueueUrl=self.queue_url,
+                    Entries=entries
+                )
+                for failed in response.get('Failed', []):
+                    print(f"Failed to delete message {failed.get('Id')}: {failed.get('Message')}")
+            except Exception as e:
+                print(f"Batch delete failed, messages will be redelivered: {e}")
+                traceback.print_exc()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
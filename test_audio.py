@@ -0,0 +1,58 @@
+import io
+import wave
+
+from audio import split_audio, segment_seconds, plan_cuts, wav_bytes, sound_segments, to_original_time, select_filter, UPLOAD_CODECS, SAMPLE_RATE
+
+
+def test_segment_seconds():
+    # 128 kbps mp3, 20 MB budget: 20 * 1024 * 1024 * 8 / 128000 = 1310s, 90% of that
+    assert segment_seconds(128000, 20 * 1024 * 1024) == 1179, "Should leave a 10% margin under the budget"
+    assert segment_seconds(128000, 20 * 1024 * 1024, margin=1) == 1310, "Should fill the budget without margin"
+    assert segment_seconds(10 ** 9, 1000) == 1, "Should never return an empty segment"
+
+
+def test_upload_codecs_fit_an_episode_in_few_parts():
+    for codec, (args, _) in UPLOAD_CODECS.items():
+        bit_rate = int(args[args.index('-b:a') + 1].rstrip('k')) * 1000
+        # a two hour episode in at most two 20 MB parts
+        assert segment_seconds(bit_rate, 20 * 1024 * 1024) >= 3600, f"{codec} at {bit_rate} bps should fit an hour per part"
+
+
+def test_plan_cuts_snap_to_silence():
+    silences = [(100, 101), (550, 552), (590, 591), (1300, 1302)]
+    cuts = plan_cuts(silences, duration=1500, max_seconds=600)
+    assert cuts == [590.5, 1190.5], f"Should cut at the latest silence in each window, got {cuts}"
+    assert all(b - a <= 600 for a, b in zip([0] + cuts, cuts + [1500])), "No segment should exceed max_seconds"
+
+    assert plan_cuts([], duration=1500, max_seconds=600) == [600, 1200], "Should fall back to fixed cuts without silences"
+    assert plan_cuts(silences, duration=500, max_seconds=600) == [], "Should not cut audio that fits in one segment"
+    assert plan_cuts([(100, 101)], duration=1000, max_seconds=600) == [600], "Should ignore silences that make a segment too short"
+
+
+def test_wav_bytes():
+    pcm = b'\x01\x00' * SAMPLE_RATE  # one second of audio
+    with wave.open(io.BytesIO(wav_bytes(pcm))) as wav:
+        assert wav.getframerate() == SAMPLE_RATE, "Should be 16 kHz"
+        assert wav.getnchannels() == 1 and wav.getsampwidth() == 2, "Should be mono 16-bit"
+        assert wav.readframes(wav.getnframes()) == pcm, "Should keep the pcm data"
+
+
+def test_sound_segments_and_time_map():
+    # 30s music-free intro silence, a 10s ad gap, trailing silence to the end
+    silences = [(0, 30), (300, 310), (595, 600)]
+    segments = sound_segments(silences, duration=600, padding=0.25)
+    assert segments == [(29.75, 300.25), (309.75, 595.25)], f"Should keep the padded audio between silences, got {segments}"
+    assert sound_segments([], duration=600) == [(0.0, 600)], "Audio without silences should be kept whole"
+
+    assert to_original_time(segments, 0) == 29.75, "Speech time 0 is the start of the first segment"
+    assert to_original_time(segments, 270.5) == 300.25, "End of the first segment"
+    assert to_original_time(segments, 271.5) == 310.75, "Times after the gap should skip the dropped silence"
+    assert "between(t,29.75,300.25)+between(t,309.75,595.25)" in select_filter(segments), "Filter should select each segment"
+
+
+def test_split_audio_keeps_a_file_that_fits(tmp_path):
+    # not even audio: a file under the limit must not be probed or transcoded
+    path = tmp_path / 'episode.m4a'
+    path.write_bytes(b'x' * 1000)
+    assert split_audio(str(path), str(tmp_path / 'part_'), 2000) == [str(path)], "Should return the file unchanged"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['episode.m4a'], "Should not write any parts"
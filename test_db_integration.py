@@ -35,6 +35,24 @@ def test_fetch_save_update_episodes():
     episodes.remove({ 'url': 'url' })
 
 
+def test_batch_upsert():
+    db = LocalStorageDb({'namespace': 'batch', 'storage_path': './test_data'})
+    db.add_collection('episodes')
+
+    docs = [{'url': f'https://example.com/{i}', 'status': 'todo'} for i in range(50)]
+    inserted = db.episodes.upsert(docs)
+    assert len(inserted) == 50, 'returns all inserted docs'
+    assert all('_id' in doc for doc in inserted), 'generates ids'
+
+    # reload from disk
+    db = LocalStorageDb({'namespace': 'batch', 'storage_path': './test_data'})
+    db.add_collection('episodes')
+    urls = {ep['url'] for ep in db.episodes.find({}).fetch()}
+    assert len(urls) == 50, f"Expected 50 persisted episodes, got {len(urls)}"
+
+    db.remove_collection('episodes')
+
+
 def test_basic_ops():
     # Create database
     db = LocalStorageDb({'namespace': 'myapp', 'storage_path': './test_data'})
@@ -224,6 +242,7 @@ if __name__ == "__main__":
 
         test_basic_ops()
         test_fetch_save_update_episodes()
+        test_batch_upsert()
         print("\n🎉 All tests passed successfully!")
     except Exception as e:
         print(f"\n❌ Test failed: {e}")
@@ -0,0 +1,66 @@
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from file_queue import FileQueue
+
+QUEUE_PATH = './test_data/queue.sqlite3'
+
+def new_queue(**kwargs):
+    if os.path.exists('./test_data'):
+        shutil.rmtree('./test_data')
+    return FileQueue(QUEUE_PATH, **kwargs)
+
+def test_visibility_and_delete():
+    queue = new_queue()
+    queue.send_message(MessageBody='a')
+    queue.send_message(MessageBody='b')
+
+    messages = queue.receive_message(MaxNumberOfMessages=10, VisibilityTimeout=1)['Messages']
+    assert [m['Body'] for m in messages] == ['a', 'b'], 'receives in send order'
+    assert queue.receive_message(MaxNumberOfMessages=10)['Messages'] == [], 'received messages are invisible'
+
+    queue.delete_message(ReceiptHandle=messages[0]['ReceiptHandle'])
+    time.sleep(1.1)
+    redelivered = queue.receive_message(MaxNumberOfMessages=10)['Messages']
+    assert [m['Body'] for m in redelivered] == ['b'], 'undeleted message is redelivered after the timeout'
+    assert redelivered[0]['Attributes']['ApproximateReceiveCount'] == '2'
+
+    result = queue.delete_message_batch(Entries=[
+        {'Id': '0', 'ReceiptHandle': messages[1]['ReceiptHandle']},
+        {'Id': '1', 'ReceiptHandle': redelivered[0]['ReceiptHandle']},
+    ])
+    assert [f['Id'] for f in result['Failed']] == ['0'], 'stale receipt handles are rejected'
+    assert queue.get_queue_attributes()['Attributes']['ApproximateNumberOfMessages'] == '0'
+
+def test_delay_and_dead_letter():
+    queue = new_queue(max_receives=2)
+    queue.send_message(MessageBody='later', DelaySeconds=60)
+    assert queue.receive_message()['Messages'] == [], 'delayed message is not visible yet'
+
+    queue.send_message(MessageBody='poison')
+    for _ in range(2):
+        [message] = queue.receive_message(VisibilityTimeout=60)['Messages']
+        queue.change_message_visibility(ReceiptHandle=message['ReceiptHandle'], VisibilityTimeout=0)
+
+    assert queue.receive_message()['Messages'] == [], 'message over max receives is not delivered'
+    assert [m['Body'] for m in queue.dead_letters()] == ['poison'], 'message moved to dead letters'
+
+def test_concurrent_receivers_get_distinct_messages():
+    queue = new_queue()
+    for i in range(50):
+        queue.send_message(MessageBody=str(i))
+
+    def drain(_):
+        bodies = []
+        while True:
+            messages = queue.receive_message(MaxNumberOfMessages=3, VisibilityTimeout=60)['Messages']
+            if not messages:
+                return bodies
+            bodies.extend(m['Body'] for m in messages)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        received = [body for bodies in executor.map(drain, range(4)) for body in bodies]
+    assert sorted(received, key=int) == [str(i) for i in range(50)], 'each message delivered exactly once'
+    shutil.rmtree('./test_data')
@@ -0,0 +1,46 @@
+import json
+import os
+import shutil
+
+from metrics import Registry, load_snapshots
+
+METRICS_DIR = './test_data/metrics'
+
+
+def test_render():
+    registry = Registry()
+    jobs = registry.counter('jobs_total', 'Finished jobs')
+    jobs.inc(result='done')
+    jobs.inc(2, result='error')
+    seconds = registry.histogram('stage_seconds', 'Stage latency', buckets=(1, 10))
+    seconds.observe(0.5, stage='format')
+    seconds.observe(5, stage='format')
+
+    text = registry.render()
+    assert '# TYPE jobs_total counter' in text, "Should declare the metric type"
+    assert 'jobs_total{result="error"} 2' in text, "Should render labelled counter values"
+    assert 'stage_seconds_bucket{stage="format",le="1"} 1' in text, "Buckets should be cumulative"
+    assert 'stage_seconds_bucket{stage="format",le="+Inf"} 2' in text, "Should count every observation in +Inf"
+    assert 'stage_seconds_sum{stage="format"} 5.5' in text, "Should sum observations"
+
+
+def test_merge_snapshots():
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+    worker = Registry()
+    worker.counter('jobs_total', 'Finished jobs').inc(3, result='done')
+    worker.dump(METRICS_DIR)
+    # a snapshot of our own pid is skipped, pretend it came from the parent process
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    with open(path) as f:
+        data = json.load(f)
+    data['pid'] = os.getppid()
+    with open(os.path.join(METRICS_DIR, f"{os.getppid()}.json"), 'w') as f:
+        json.dump(data, f)
+    os.remove(path)
+    assert len(load_snapshots(METRICS_DIR)) == 1, "Should load the worker snapshot"
+
+    web = Registry()
+    web.counter('jobs_total', 'Finished jobs').inc(result='done')
+    text = web.render(include_snapshots=True, directory=METRICS_DIR)
+    assert 'jobs_total{result="done"} 4' in text, "Should sum counters across processes"
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+import offline
+
+
+def zero_latency(monkeypatch):
+    for name in offline.LATENCIES:
+        monkeypatch.setenv(f'OFFLINE_LATENCY_{name.upper()}', '0')
+
+
+def test_sources_are_deterministic(monkeypatch):
+    zero_latency(monkeypatch)
+    episodes, _ = offline.pocketcasts_history()
+    again, _ = offline.pocketcasts_history()
+    assert len(episodes) == offline.OFFLINE_EPISODES, "Should return OFFLINE_EPISODES episodes"
+    assert episodes == again, "Stub episodes should be the same on every pull"
+
+    episode = episodes[0]
+    transcript = asyncio.run(offline.transcribe_from_url(episode['url'], ''))
+    expected = episode['duration'] * offline.CHARS_PER_AUDIO_SECOND
+    assert expected <= len(transcript) < expected + 200, "Transcript length should follow the episode duration"
+
+
+def test_latency_is_configurable(monkeypatch):
+    zero_latency(monkeypatch)
+    monkeypatch.setenv('OFFLINE_LATENCY_LLM', '0.2')
+    client = offline.StubOpenAI()
+    loop = asyncio.new_event_loop()
+    started = loop.time()
+    response = loop.run_until_complete(client.chat.completions.create(messages=[{'role': 'user', 'content': 'hello'}], model='stub'))
+    elapsed = loop.time() - started
+    loop.close()
+    assert 0.2 <= elapsed < 0.5, f"Should sleep for the configured latency, took {elapsed:.2f}s"
+    assert response.choices[0].message.content == 'hello', "Should echo the prompt"
+    assert response.usage.prompt_tokens > 0, "Should report usage like the real client"
+
+
+def test_schema_answer(monkeypatch):
+    zero_latency(monkeypatch)
+    client = offline.StubGenaiClient()
+    schema = {'type': 'object', 'properties': {'qas': {'type': 'array'}, 'title': {'type': 'string'}}}
+    response = client.models.generate_content(model='stub', contents='text', config={'responseSchema': schema})
+    assert json.loads(response.text) == {'qas': []}, "Should answer with empty lists for array properties"
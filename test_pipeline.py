@@ -0,0 +1,157 @@
+import asyncio
+
+from pipeline import Pipeline, Stage, Job
+
+def test_pipeline_runs_stages_in_order():
+    async def run():
+        seen = []
+        done = []
+        errors = []
+
+        async def first(item):
+            item['steps'].append('first')
+            return item
+
+        async def second(item):
+            if item['fail']:
+                raise Exception('boom')
+            item['steps'].append('second')
+            return item
+
+        pipeline = Pipeline(
+            [Stage('first', first, 2), Stage('second', second, 1)],
+            on_stage=lambda job, stage: seen.append((job.item['id'], stage))
+        )
+        pipeline.start()
+        for i in range(4):
+            await pipeline.submit(Job(
+                {'id': i, 'steps': [], 'fail': i == 3},
+                on_done=lambda job: done.append(job.item),
+                on_error=lambda job, e: errors.append((job.item['id'], str(e)))
+            ))
+        await asyncio.wait_for(pipeline.join(), timeout=5)
+        await pipeline.close()
+
+        assert sorted(item['id'] for item in done) == [0, 1, 2], 'successful jobs complete'
+        assert all(item['steps'] == ['first', 'second'] for item in done), 'stages run in order'
+        assert errors == [(3, 'boom')], 'failed job reports its error'
+        assert (0, 'second') in seen, 'stage hook is called'
+
+    asyncio.run(run())
+
+def test_pipeline_stage_concurrency():
+    async def run():
+        active = 0
+        peak = 0
+
+        async def slow(item):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return item
+
+        pipeline = Pipeline([Stage('slow', slow, 3)])
+        pipeline.start()
+        for i in range(10):
+            await pipeline.submit(Job({'id': i}))
+        await asyncio.wait_for(pipeline.join(), timeout=5)
+        await pipeline.close()
+        assert peak == 3, f"Expected 3 concurrent jobs, got {peak}"
+
+    asyncio.run(run())
+
+def test_pipeline_job_context_collects_spans():
+    import contextvars
+    from tracing import start_trace, span
+
+    async def run():
+        async def stage(item):
+            with span('work', part=item['id']):
+                await asyncio.sleep(0)
+            return item
+
+        pipeline = Pipeline([Stage('a', stage), Stage('b', stage)])
+        pipeline.start()
+        context = contextvars.copy_context()
+        trace = context.run(start_trace, 'episode')
+        await pipeline.submit(Job({'id': 1}, context=context))
+        await asyncio.wait_for(pipeline.join(), timeout=5)
+        await pipeline.close()
+        assert [s['name'] for s in trace.spans] == ['work', 'work'], 'both stages record on the job trace'
+
+    asyncio.run(run())
+
+def test_pipeline_free_slots_and_cancelled_submit():
+    async def run():
+        release = asyncio.Event()
+
+        async def blocked(item):
+            await release.wait()
+            return item
+
+        pipeline = Pipeline([Stage('blocked', blocked, 1)])
+        pipeline.start()
+        assert pipeline.free_slots() == 1, "An empty queue of size 1 should have one free slot"
+        await pipeline.submit(Job({'id': 1}))
+        await asyncio.sleep(0.01)  # the worker takes job 1
+        await pipeline.submit(Job({'id': 2}))
+        assert pipeline.free_slots() == 0, "A full queue should have no free slots"
+
+        waiting = asyncio.create_task(pipeline.submit(Job({'id': 3})))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert pipeline.in_flight == 2, f"A cancelled submit should not count as in flight, got {pipeline.in_flight}"
+
+        release.set()
+        await asyncio.wait_for(pipeline.join(), timeout=5)
+        await pipeline.close()
+
+    asyncio.run(run())
+
+
+def test_pipeline_reserved_slots():
+    async def run():
+        release = asyncio.Event()
+
+        async def blocked(item):
+            await release.wait()
+            return item
+
+        pipeline = Pipeline([Stage('blocked', blocked, 1, queue_size=3)])
+        pipeline.start()
+        assert pipeline.reserve(2) == 2, "Should reserve from the 3 free slots"
+        assert pipeline.reserve(10) == 1, "Other consumers should only get the slot left over"
+        assert pipeline.free_slots() == 0, "Reserved slots should not count as free"
+
+        await asyncio.wait_for(pipeline.submit(Job({'id': 1}), reserved=True), timeout=1)
+        pipeline.release(2)
+        assert pipeline.reserved == 0, f"Every reservation should be used or released, {pipeline.reserved} left"
+
+        release.set()
+        await asyncio.wait_for(pipeline.join(), timeout=5)
+        await pipeline.close()
+
+    asyncio.run(run())
+
+
+def test_pipeline_close_cancels_unfinished_jobs():
+    async def run():
+        cancelled = []
+
+        async def stuck(item):
+            await asyncio.Event().wait()
+            return item
+
+        pipeline = Pipeline([Stage('stuck', stuck, 1, queue_size=2)])
+        pipeline.start()
+        for i in range(3):
+            await pipeline.submit(Job({'id': i}, on_cancel=lambda job: cancelled.append(job.item['id'])))
+        await asyncio.sleep(0.01)
+        await pipeline.close()
+        assert sorted(cancelled) == [0, 1, 2], f"Running and queued jobs should be cancelled, got {cancelled}"
+        assert pipeline.in_flight == 0 and not pipeline.jobs, "Nothing should be left in flight after close"
+
+    asyncio.run(run())
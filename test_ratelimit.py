@@ -0,0 +1,47 @@
+import ratelimit
+from ratelimit import RateLimiter, Limit, is_rate_limited
+
+
+def create_limiter(tmp_path, monkeypatch, **limits):
+    monkeypatch.setattr(ratelimit, 'RATE_LIMIT_PATH', str(tmp_path / 'buckets.sqlite3'))
+    return RateLimiter(limits=limits)
+
+
+def test_request_budget(tmp_path, monkeypatch):
+    limiter = create_limiter(tmp_path, monkeypatch, openai=Limit(rpm=2, tpm=None))
+    assert limiter.try_acquire('openai', 'gpt-5-mini') == 0, "Should allow the first request"
+    assert limiter.try_acquire('openai', 'gpt-5-mini') == 0, "Should allow a burst up to rpm"
+    wait = limiter.try_acquire('openai', 'gpt-5-mini')
+    assert 25 < wait <= 30, f"Should wait for one request to refill (30s at 2 rpm), got {wait}"
+    assert limiter.try_acquire('openai', 'other-model') == 0, "Buckets should be per model"
+    assert limiter.try_acquire('ollama', 'qwen2.5') == 0, "Providers without limits should never wait"
+
+
+def test_token_budget_shared(tmp_path, monkeypatch):
+    limiter = create_limiter(tmp_path, monkeypatch, google=Limit(rpm=100, tpm=6000))
+    other_worker = RateLimiter(limits={'google': Limit(rpm=100, tpm=6000)})
+    assert limiter.try_acquire('google', 'gemini', 5000) == 0, "Should fit in the token budget"
+    wait = other_worker.try_acquire('google', 'gemini', 5000)
+    assert 39 < wait <= 40, f"Another worker should see the spent tokens and wait for 4000 more, got {wait}"
+
+    limiter.settle('google', 'gemini', 5000, 1000)
+    assert other_worker.try_acquire('google', 'gemini', 5000) == 0, "Unused estimated tokens should be returned"
+
+
+def test_pause_on_429(tmp_path, monkeypatch):
+    limiter = create_limiter(tmp_path, monkeypatch, google=Limit(rpm=100, tpm=None))
+    limiter.pause('google', 'gemini', 20)
+    wait = limiter.try_acquire('google', 'gemini')
+    assert 19 < wait <= 20, f"Should hold requests while paused, got {wait}"
+
+    class RateLimitError(Exception):
+        pass
+
+    try:
+        try:
+            raise RateLimitError('429 Too Many Requests')
+        except Exception as e:
+            raise Exception('Failed to generate content part 1') from e
+    except Exception as wrapped:
+        assert is_rate_limited(wrapped), "Should detect a wrapped rate limit error"
+    assert not is_rate_limited(ValueError('bad json')), "Other errors are not rate limits"
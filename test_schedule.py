@@ -0,0 +1,55 @@
+from datetime import datetime
+
+from schedule import CronSchedule, next_run, due_sources
+
+def test_cron_next_after():
+    daily = CronSchedule('0 12 * * *')
+    assert daily.next_after(datetime(2025, 1, 1, 11, 59, 30)) == datetime(2025, 1, 1, 12, 0)
+    assert daily.next_after(datetime(2025, 1, 1, 12, 0)) == datetime(2025, 1, 2, 12, 0), 'strictly after'
+
+    every_15 = CronSchedule('*/15 * * * *')
+    assert every_15.next_after(datetime(2025, 1, 1, 10, 7)) == datetime(2025, 1, 1, 10, 15)
+    assert every_15.next_after(datetime(2025, 1, 1, 23, 50)) == datetime(2025, 1, 2, 0, 0)
+
+    # 2025-01-06 is a Monday
+    weekdays = CronSchedule('30 9 * * 1-5')
+    assert weekdays.next_after(datetime(2025, 1, 4, 10, 0)) == datetime(2025, 1, 6, 9, 30), 'skips weekend'
+
+    yearly = CronSchedule('@yearly')
+    assert yearly.next_after(datetime(2025, 3, 1)) == datetime(2026, 1, 1, 0, 0)
+
+    leap = CronSchedule('0 0 29 2 *')
+    assert leap.next_after(datetime(2025, 1, 1)) == datetime(2028, 2, 29, 0, 0)
+
+def test_cron_day_or_weekday():
+    # day 1 of the month OR any Sunday; 2025-01-05 is a Sunday
+    spec = CronSchedule('0 0 1 * 0')
+    assert spec.next_after(datetime(2025, 1, 2)) == datetime(2025, 1, 5)
+    assert spec.next_after(datetime(2025, 1, 26, 1)) == datetime(2025, 2, 1)
+
+def test_cron_weekday_7_is_sunday():
+    # 2025-01-03 is a Friday
+    weekend = CronSchedule('0 0 * * 5-7')
+    assert weekend.weekdays == {5, 6, 0}, f"7 should be folded into Sunday, got {weekend.weekdays}"
+    assert weekend.next_after(datetime(2025, 1, 4, 1)) == datetime(2025, 1, 5), 'Sunday via 7'
+    assert CronSchedule('0 0 * * 7').weekdays == {0}
+    assert CronSchedule('0 0 * * *').weekdays == set(range(7))
+
+def test_cron_rejects_bad_expressions():
+    for expr in ['* * * *', '60 * * * *', '*/0 * * * *', '5-1 * * * *']:
+        try:
+            CronSchedule(expr)
+        except ValueError:
+            continue
+        assert False, f"Expected {expr!r} to be rejected"
+
+def test_missed_runs_catch_up():
+    schedules = {'pocketcasts': CronSchedule('0 12 * * *'), 'youtube': CronSchedule('0 * * * *')}
+    started = datetime(2025, 1, 3, 8, 0)
+    last_runs = {'pocketcasts': datetime(2025, 1, 1, 12, 0)}
+
+    # pocketcasts missed two days: one catch-up run, due immediately
+    assert next_run(schedules['pocketcasts'], last_runs['pocketcasts'], started) == datetime(2025, 1, 2, 12, 0)
+    assert due_sources(schedules, last_runs, started, started) == ['pocketcasts']
+    # youtube never ran: scheduled from process start
+    assert due_sources(schedules, last_runs, started, datetime(2025, 1, 3, 9, 0)) == ['pocketcasts', 'youtube']
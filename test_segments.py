@@ -0,0 +1,42 @@
+import math
+from types import SimpleNamespace
+
+from segments import Segment, from_whisper_cpp, from_verbose_json, shift, to_original, dumps, loads, to_rows, from_rows
+
+
+def test_from_whisper_cpp():
+    data = {'transcription': [{
+        'offsets': {'from': 1500, 'to': 4200},
+        'text': ' Hello there.',
+        'tokens': [
+            {'text': '[_BEG_]', 'p': 0.99},
+            {'text': ' Hello', 'p': 0.9},
+            {'text': ' there.', 'p': 0.5},
+        ],
+    }]}
+    [segment] = from_whisper_cpp(data)
+    assert (segment.start, segment.end, segment.text) == (1.5, 4.2, 'Hello there.'), f"Unexpected segment {segment}"
+    expected = (math.log(0.9) + math.log(0.5)) / 2
+    assert abs(segment.avg_logprob - expected) < 1e-9, "avg_logprob should skip special tokens"
+
+
+def test_from_verbose_json_objects_and_dicts():
+    api = [SimpleNamespace(start=0.0, end=2.5, text=' a', avg_logprob=-0.1)]
+    server = [{'start': 0.0, 'end': 2.5, 'text': ' a', 'avg_logprob': -0.1}]
+    assert from_verbose_json(api) == from_verbose_json(server) == [Segment(0.0, 2.5, 'a', -0.1)], "Both formats should parse the same"
+    assert from_verbose_json(None) == [], "Missing segments should give an empty list"
+
+
+def test_times_and_compact_storage():
+    segments = shift([Segment(0.0, 10.0, 'intro', -0.2), Segment(10.0, 20.0, 'more', None)], 600)
+    assert segments[0].start == 600 and segments[1].end == 620, "Parts should be offset by their start"
+
+    kept = [(30.0, 300.0), (310.0, 600.0)]
+    mapped = to_original([Segment(265.0, 275.0, 'across the gap')], kept)
+    assert (mapped[0].start, mapped[0].end) == (295.0, 315.0), f"Should map back past the dropped silence, got {mapped[0]}"
+    assert to_original(segments, None) == segments, "Untrimmed times stay as they are"
+
+    data = dumps(segments)
+    assert data == '[[600000,610000,-0.2,"intro"],[610000,620000,null,"more"]]', f"Unexpected compact form {data}"
+    assert loads(data) == segments, "Segments should round-trip"
+    assert from_rows(to_rows(segments)) == segments, "Rows stored on the episode should round-trip"
@@ -0,0 +1,84 @@
+import asyncio
+import time
+import uuid
+
+from sqs_worker import SqsWorker
+
+class LocalSqs:
+    """In-memory stand-in for the boto3 SQS calls used by SqsWorker"""
+
+    def __init__(self):
+        self.messages = {}  # id -> {'body', 'visible_at', 'receipt'}
+        self.calls = []
+
+    def send_message(self, QueueUrl, MessageBody):
+        message_id = uuid.uuid4().hex
+        self.messages[message_id] = {'body': MessageBody, 'visible_at': 0, 'receipt': None}
+        return {'MessageId': message_id}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, WaitTimeSeconds, VisibilityTimeout):
+        self.calls.append(('receive', MaxNumberOfMessages))
+        now = time.monotonic()
+        received = []
+        for message_id, message in self.messages.items():
+            if len(received) == MaxNumberOfMessages:
+                break
+            if message['visible_at'] <= now:
+                message['receipt'] = uuid.uuid4().hex
+                message['visible_at'] = now + VisibilityTimeout
+                received.append({'MessageId': message_id, 'ReceiptHandle': message['receipt'], 'Body': message['body']})
+        return {'Messages': received}
+
+    def _by_receipt(self, handle):
+        return next(k for k, m in self.messages.items() if m['receipt'] == handle)
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout):
+        self.calls.append(('visibility', VisibilityTimeout))
+        self.messages[self._by_receipt(ReceiptHandle)]['visible_at'] = time.monotonic() + VisibilityTimeout
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        self.calls.append(('delete_batch', len(Entries)))
+        for entry in Entries:
+            del self.messages[self._by_receipt(entry['ReceiptHandle'])]
+        return {'Successful': [{'Id': e['Id']} for e in Entries], 'Failed': []}
+
+def test_receive_batch_and_delete_in_batches():
+    async def run():
+        client = LocalSqs()
+        for i in range(12):
+            client.send_message(QueueUrl='q', MessageBody=f'{i}')
+
+        worker = SqsWorker(client, 'q', visibility_timeout=60, wait_seconds=0, flush_interval=60)
+        worker.start()
+        first = await worker.receive()
+        second = await worker.receive()
+        assert len(first) == 10, 'receives up to 10 messages per call'
+        assert len(second) == 2, 'in-flight messages are invisible'
+
+        for message in first + second:
+            worker.ack(message['ReceiptHandle'])
+        await worker.close()
+
+        assert client.messages == {}, 'acked messages are deleted'
+        deletes = [n for call, n in client.calls if call == 'delete_batch']
+        assert sorted(deletes) == [2, 10], f"Expected batched deletes, got {deletes}"
+
+    asyncio.run(run())
+
+def test_heartbeat_and_release():
+    async def run():
+        client = LocalSqs()
+        client.send_message(QueueUrl='q', MessageBody='job')
+        worker = SqsWorker(client, 'q', visibility_timeout=3, wait_seconds=0)
+
+        [message] = await worker.receive()
+        heartbeat = worker.heartbeat(message['ReceiptHandle'])
+        await asyncio.sleep(1.2)
+        heartbeat.stop()
+        assert ('visibility', 3) in client.calls, 'heartbeat extends visibility'
+        assert await worker.receive() == [], 'message stays invisible while running'
+
+        await worker.release(message['ReceiptHandle'])
+        assert len(await worker.receive()) == 1, 'released message is visible again'
+
+    asyncio.run(run())
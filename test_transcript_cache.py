@@ -0,0 +1,34 @@
+import os
+
+from transcript_cache import TranscriptCache, file_hash
+
+
+def test_cache_by_content_and_url(tmp_path):
+    cache = TranscriptCache(str(tmp_path / 'transcripts'))
+    audio_path = tmp_path / 'audio.mp3'
+    audio_path.write_bytes(b'audio bytes')
+
+    key = cache.key(file_hash(str(audio_path)), 'api', 'whisper-1', 'notes')
+    alias = cache.url_key('https://example.com/a.mp3', 'api', 'whisper-1', 'notes')
+    assert cache.get(key) is None, "Should miss before anything is stored"
+    cache.put(key, 'hello world', aliases=[alias], segments='[[0,1000,null,"hello world"]]')
+
+    assert cache.get(key) == 'hello world', "Should find the transcript by audio hash"
+    assert cache.get(cache.resolve(alias)) == 'hello world', "Should find the transcript by url"
+    assert cache.get_segments(cache.resolve(alias)) == '[[0,1000,null,"hello world"]]', "Should keep the segments"
+    other_prompt = cache.key(file_hash(str(audio_path)), 'api', 'whisper-1', 'other notes')
+    assert cache.get(other_prompt) is None, "Different settings should miss"
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache_dir = tmp_path / 'transcripts'
+    cache = TranscriptCache(str(cache_dir), max_bytes=250)
+    cache.put('a', 'x' * 100)
+    cache.put('b', 'x' * 100)
+    os.utime(cache_dir / 'a.txt', (1, 1))
+    os.utime(cache_dir / 'b.txt', (2, 2))
+    cache.get('a')  # a is now the most recently used
+    cache.put('c', 'x' * 100)
+
+    assert cache.get('b') is None, "Should evict the least recently used entry"
+    assert cache.get('a') is not None and cache.get('c') is not None, "Should keep recent entries"
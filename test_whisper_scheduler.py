@@ -0,0 +1,72 @@
+import asyncio
+
+from whisper_scheduler import WhisperScheduler, candidate_configs, MIN_SAMPLES
+
+
+def test_candidate_configs_fit_the_cores():
+    for cores in (1, 2, 4, 8, 16, 64):
+        configs = candidate_configs(cores)
+        assert configs, f"{cores} cores should have a configuration"
+        assert all(jobs * threads <= cores for jobs, threads in configs), f"{configs} oversubscribe {cores} cores"
+    assert candidate_configs(16) == [(4, 4), (2, 8)], f"Unexpected splits for 16 cores: {candidate_configs(16)}"
+    assert candidate_configs(16, jobs=2) == [(2, 8)], "Pinned jobs should get the remaining cores as threads"
+    assert candidate_configs(16, jobs=3, threads=2) == [(3, 2)], "Pinning both should be used as is"
+
+
+def test_explores_then_picks_highest_throughput(tmp_path):
+    stats_file = str(tmp_path / 'whisper_rtf.json')
+    scheduler = WhisperScheduler(stats_file=stats_file, cores=16)
+    assert scheduler.config == (4, 4), "Untried configurations should be tried first"
+    for _ in range(MIN_SAMPLES):
+        # 4 jobs at 0.5 RTF: 8 audio seconds per second
+        scheduler.record((4, 4), 4, 600, 300)
+    assert scheduler.config == (2, 8), "Should move on to the next untried configuration"
+    for _ in range(MIN_SAMPLES):
+        # 2 jobs at 0.2 RTF: 10 audio seconds per second
+        scheduler.record((2, 8), 2, 600, 120)
+    assert scheduler.config == (2, 8), f"Should pick the faster split, got {scheduler.config}"
+
+    reloaded = WhisperScheduler(cores=16, stats_file=stats_file)
+    assert reloaded.config == (2, 8), "Measurements should survive a restart"
+
+
+def test_idle_slots_lower_the_score(tmp_path):
+    stats_file = str(tmp_path / 'whisper_rtf.json')
+    scheduler = WhisperScheduler(stats_file=stats_file, cores=16)
+    for _ in range(MIN_SAMPLES):
+        # only one episode at a time: 4 threads at 0.3 RTF
+        scheduler.record((4, 4), 1, 600, 180)
+        scheduler.record((2, 8), 1, 600, 120)
+    assert scheduler.config == (2, 8), "More threads should win when there is only one job to run"
+
+
+def test_slots_limit_jobs_and_threads(tmp_path):
+    stats_file = str(tmp_path / 'whisper_rtf.json')
+    scheduler = WhisperScheduler(stats_file=stats_file, cores=8, jobs=2)
+    running, peak, threads_seen = 0, 0, set()
+
+    async def job():
+        nonlocal running, peak
+        async with scheduler.slot() as run:
+            running += 1
+            peak = max(peak, running)
+            threads_seen.add(run.threads)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    async def main():
+        await asyncio.gather(*(job() for _ in range(5)))
+
+    asyncio.run(main())
+    assert peak == 2, f"At most 2 jobs should run at once, saw {peak}"
+    assert threads_seen == {4}, f"Each job should get 4 of the 8 cores, got {threads_seen}"
+
+
+def test_processes_share_the_stats_file(tmp_path):
+    stats_file = str(tmp_path / 'whisper_rtf.json')
+    first = WhisperScheduler(cores=8, stats_file=stats_file)
+    second = WhisperScheduler(cores=8, stats_file=stats_file)
+    first.record((4, 2), 4, 600, 300)
+    second.record((4, 2), 4, 600, 300)
+    first.record((4, 2), 4, 600, 300)
+    assert first.stats['4x2']['runs'] == 3, f"Runs recorded by another process should be kept, got {first.stats['4x2']['runs']}"
@@ -0,0 +1,46 @@
+import os
+import shutil
+import time
+
+from workdir import job_dir, ensure_disk_space, remove_stale_job_dirs, DiskSpaceError
+
+WORK_DIR = './test_data/work'
+
+
+def test_job_dirs_are_isolated():
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+    with job_dir('a', root=WORK_DIR) as first, job_dir('a', root=WORK_DIR) as second:
+        assert first != second, "Concurrent jobs should get different directories"
+        with open(os.path.join(first, 'audio.wav'), 'w') as f:
+            f.write('first')
+        assert not os.path.exists(os.path.join(second, 'audio.wav')), "Files should not be shared"
+    assert not os.path.exists(first) and not os.path.exists(second), "Directories should be removed on exit"
+
+    try:
+        with job_dir('b', root=WORK_DIR) as path:
+            raise ValueError('ffmpeg failed')
+    except ValueError:
+        pass
+    assert not os.path.exists(path), "Directory should be removed when the job fails"
+
+
+def test_disk_space_guard():
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+    ensure_disk_space(1024, WORK_DIR, min_free=0)
+    free = shutil.disk_usage('.').free
+    try:
+        ensure_disk_space(free * 2, WORK_DIR, min_free=0)
+        assert False, "Should refuse a job that does not fit"
+    except DiskSpaceError:
+        pass
+
+
+def test_remove_stale_job_dirs():
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+    os.makedirs(f'{WORK_DIR}/job-old')
+    os.makedirs(f'{WORK_DIR}/job-new')
+    old = time.time() - 7 * 3600
+    os.utime(f'{WORK_DIR}/job-old', (old, old))
+    assert remove_stale_job_dirs(WORK_DIR) == 1, "Should remove only the stale directory"
+    assert os.path.exists(f'{WORK_DIR}/job-new'), "Should keep recent job directories"
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
@@ -0,0 +1,105 @@
+import json
+import os
+import time
+import uuid
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+TRACE_FILE = os.getenv('TRACE_FILE', './data/traces.jsonl')
+
+
+class Trace:
+    """Spans recorded while processing one episode"""
+
+    def __init__(self, name: str, **attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.spans: List[Dict[str, Any]] = []
+
+    def summary(self, status: str) -> Dict[str, Any]:
+        return {
+            'trace_id': self.id,
+            'name': self.name,
+            'status': status,
+            'start': self.start,
+            'duration': round(time.time() - self.start, 3),
+            'attrs': self.attrs,
+            'spans': self.spans,
+        }
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar('current_trace', default=None)
+current_span: ContextVar[Optional[Dict[str, Any]]] = ContextVar('current_span', default=None)
+
+
+def start_trace(name: str, **attrs) -> Trace:
+    """Start a trace in the current context, spans opened in this context (and tasks
+    or threads started from it) are recorded on it"""
+    trace = Trace(name, **attrs)
+    current_trace.set(trace)
+    return trace
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a block of work, yields a dict the block can add counts to (bytes, tokens, ...)"""
+    trace = current_trace.get()
+    parent = current_span.get()
+    record = {
+        'id': uuid.uuid4().hex[:8],
+        'parent': parent['id'] if parent else None,
+        'name': name,
+        'start': round(time.time() - trace.start, 3) if trace else 0,
+        'attrs': dict(attrs),
+    }
+    token = current_span.set(record)
+    began = time.perf_counter()
+    try:
+        yield record['attrs']
+    except Exception as e:
+        record['error'] = type(e).__name__
+        raise
+    finally:
+        record['duration'] = round(time.perf_counter() - began, 3)
+        current_span.reset(token)
+        if trace:
+            trace.spans.append(record)
+
+
+def traced(name: str):
+    """Decorator wrapping an async function in a span"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(**attrs):
+    """Add counts to the innermost open span, e.g. token usage reported by an API"""
+    open_span = current_span.get()
+    if open_span is not None:
+        for key, value in attrs.items():
+            if isinstance(value, (int, float)) and isinstance(open_span['attrs'].get(key), (int, float)):
+                open_span['attrs'][key] += value
+            else:
+                open_span['attrs'][key] = value
+
+
+def finish_trace(trace: Trace, status: str, path: str = TRACE_FILE) -> Dict[str, Any]:
+    """Append the trace to the local trace file, returns its summary"""
+    summary = trace.summary(status)
+    try:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(json.dumps(summary, ensure_ascii=False) + '\n')
+    except IOError as e:
+        print(f"Failed to write trace {trace.id}: {e}")
+    return summary
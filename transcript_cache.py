@@ -0,0 +1,93 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import Optional
+
+from checkpoint import content_hash
+
+TRANSCRIPT_CACHE_DIR = os.getenv('TRANSCRIPT_CACHE_DIR', './data/transcripts')
+TRANSCRIPT_CACHE_MB = int(os.getenv('TRANSCRIPT_CACHE_MB', 200))
+
+
+def file_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """sha256 of a file's content, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TranscriptCache:
+    """Transcripts on disk keyed by audio content hash and transcription settings
+
+    A URL alias is stored next to each entry so a re-queued episode is found without
+    downloading it again. Timestamped segments, if any, are kept in a `.segments`
+    file. The least recently used entries are removed once the cache grows over
+    `max_bytes`.
+    """
+
+    def __init__(self, directory: str = TRANSCRIPT_CACHE_DIR, max_bytes: int = TRANSCRIPT_CACHE_MB * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, audio_hash: str, *settings) -> str:
+        return content_hash(audio_hash, *settings)
+
+    def url_key(self, url: str, *settings) -> str:
+        return content_hash('url', url, *settings)
+
+    def _read(self, path: Path) -> Optional[str]:
+        try:
+            text = path.read_text(encoding='utf-8')
+        except (FileNotFoundError, IOError):
+            return None
+        # mtime is the last use, for eviction
+        os.utime(path)
+        return text
+
+    def get(self, key: str) -> Optional[str]:
+        return self._read(self.directory / f'{key}.txt')
+
+    def get_segments(self, key: str) -> Optional[str]:
+        return self._read(self.directory / f'{key}.segments')
+
+    def resolve(self, alias: str) -> Optional[str]:
+        """The key an alias points to"""
+        key = self._read(self.directory / f'{alias}.alias')
+        return key.strip() if key else None
+
+    def _write(self, path: Path, text: str):
+        tmp_path = path.with_name(f'{path.name}.tmp')
+        tmp_path.write_text(text, encoding='utf-8')
+        os.replace(tmp_path, path)
+
+    def put(self, key: str, text: str, aliases=(), segments: Optional[str] = None):
+        self._write(self.directory / f'{key}.txt', text)
+        if segments is not None:
+            self._write(self.directory / f'{key}.segments', segments)
+        for alias in aliases:
+            (self.directory / f'{alias}.alias').write_text(key, encoding='utf-8')
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in self.directory.iterdir():
+            if path.suffix == '.tmp':
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            # an alias left pointing to an evicted transcript just misses
+            try:
+                path.unlink()
+                total -= size
+            except FileNotFoundError:
+                pass
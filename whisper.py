@@ -1,140 +1,578 @@
 import os
+import json
+import time
+import fcntl
+import shutil
+import signal
 import subprocess
 import asyncio
 import traceback
 import requests
-from openai import OpenAI
-from pydub import AudioSegment
-from pydub.utils import make_chunks
+from pathlib import Path
+from contextlib import contextmanager
 from env import *
+import offline
+if offline.OFFLINE:
+    from offline import StubOpenAI as AsyncOpenAI
+else:
+    from openai import AsyncOpenAI
+from tracing import span
+from checkpoint import content_hash
+from metrics import REGISTRY
+from workdir import job_dir, ensure_disk_space, WORK_DIR
+from audio import (split_audio, probe, decode_command, wav_bytes, detect_silences, sound_segments,
+                   extract_segments, transcode_for_upload, PCM_BYTES_PER_SECOND, TRIM_MIN_SILENCE, UPLOAD_CODECS)
+from whisper_server import WhisperServer
+from transcript_cache import TranscriptCache, file_hash
+from whisper_scheduler import WhisperScheduler, available_cores
+import segments as transcript_segments
 
-client = OpenAI()
+client = AsyncOpenAI()
 whisper_local = os.getenv("WHISPER_LOCAL", None)
+WHISPER_MODEL = "ggml-large-v3-turbo-q5_0.bin"
+# Local whisper is CPU bound: the scheduler splits the cores into concurrent jobs x threads
+# and learns the fastest split, WHISPER_JOBS / WHISPER_THREADS pin either side
+WHISPER_JOBS = int(os.getenv("WHISPER_JOBS", 0)) or None
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", 0)) or None
+scheduler = WhisperScheduler(jobs=WHISPER_JOBS, threads=WHISPER_THREADS)
+# whisper.cpp's Silero voice activity detection: music, ads and silence are skipped and
+# only speech is transcribed, timestamps stay those of the original audio (local whisper only)
+WHISPER_VAD = os.getenv("WHISPER_VAD", "").lower() in ("1", "true", "yes")
+WHISPER_VAD_MODEL = os.getenv("WHISPER_VAD_MODEL", f"{whisper_local}/models/ggml-silero-v5.1.2.bin")
+VAD_ARGS = ["--vad", "--vad-model", WHISPER_VAD_MODEL] if WHISPER_VAD and whisper_local else []
+if WHISPER_VAD and not whisper_local:
+    print("WHISPER_VAD needs local whisper.cpp (WHISPER_LOCAL), the API path and external servers ignore it")
+# "1" runs a long-lived whisper.cpp server with the model loaded (needs WHISPER_LOCAL),
+# a URL uses a server started elsewhere, e.g. shared by several workers
+WHISPER_SERVER = os.getenv("WHISPER_SERVER")
+WHISPER_SERVER_URL = WHISPER_SERVER if WHISPER_SERVER and WHISPER_SERVER.startswith("http") else None
+if WHISPER_SERVER and not WHISPER_SERVER_URL and not whisper_local:
+    print("WHISPER_SERVER=1 needs WHISPER_LOCAL to start whisper-server, set a URL to use an external one")
+whisper_server = WhisperServer(
+    f"{whisper_local}/build/bin/whisper-server",
+    f"{whisper_local}/models/{WHISPER_MODEL}",
+    port=int(os.getenv("WHISPER_SERVER_PORT", 8178)),
+    # the server transcribes one request at a time, give it the whole machine
+    threads=WHISPER_THREADS or min(scheduler.cores, 8),
+    extra_args=VAD_ARGS,
+    url=WHISPER_SERVER_URL,
+) if WHISPER_SERVER_URL or (whisper_local and WHISPER_SERVER) else None
+# whisper.cpp transcribes, run here or by the server, instead of the OpenAI API
+use_whisper_cpp = bool(whisper_local or whisper_server)
+transcript_cache = None
 
-def download_audio(url, filename):
-    headers = {
-        'User-Agent': (
-            'Mozilla/5.0 (Windows NT 6.1; WOW64) '
-            'AppleWebKit/537.36 (KHTML, like Gecko) '
-            'Chrome/56.0.2924.76 Safari/537.36'
-        )
-    }
+def get_transcript_cache():
+    """The shared transcript cache, its directory is only created on the first transcription"""
+    global transcript_cache
+    if transcript_cache is None:
+        transcript_cache = TranscriptCache()
+    return transcript_cache
+
+# audio sent to the whisper server per request while ffmpeg keeps decoding
+STREAM_CHUNK_SECONDS = int(os.getenv("WHISPER_STREAM_CHUNK_SECONDS", 600))
+# API requests in flight per episode, the parts of one episode are transcribed concurrently
+WHISPER_API_CONCURRENCY = int(os.getenv("WHISPER_API_CONCURRENCY", 4))
+# drop long silences before transcribing, see find_sound
+WHISPER_TRIM_SILENCE = os.getenv("WHISPER_TRIM_SILENCE", "").lower() in ("1", "true", "yes")
+# not worth trimming when less than this fraction of the audio is silence
+TRIM_MIN_SAVING = 0.02
+# "opus" or "mp3": re-encode to 16 kHz mono before uploading to the API, fewer bytes and parts
+WHISPER_UPLOAD_CODEC = os.getenv("WHISPER_UPLOAD_CODEC") or None
+if WHISPER_UPLOAD_CODEC and WHISPER_UPLOAD_CODEC not in UPLOAD_CODECS:
+    raise ValueError(f"WHISPER_UPLOAD_CODEC must be one of {', '.join(UPLOAD_CODECS)}, got {WHISPER_UPLOAD_CODEC}")
+# whisper only looks at the last 224 tokens of a prompt
+PROMPT_NOTES_CHARS = 400
+PROMPT_TAIL_CHARS = 400
+
+WHISPER_SECONDS = REGISTRY.histogram('whisper_seconds', 'Transcription time per file by backend')
+WHISPER_RTF = REGISTRY.histogram('whisper_realtime_factor', 'Local whisper processing time / audio duration',
+                                 buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5))
+TRANSCRIPTIONS = REGISTRY.counter('transcriptions_total', 'Audio transcriptions by backend and result')
+
+DOWNLOAD_HEADERS = {
+    'User-Agent': (
+        'Mozilla/5.0 (Windows NT 6.1; WOW64) '
+        'AppleWebKit/537.36 (KHTML, like Gecko) '
+        'Chrome/56.0.2924.76 Safari/537.36'
+    )
+}
+# partial downloads are kept here, keyed by url, so a retried job resumes them;
+# a lock file next to each makes sure only one job appends to it
+DOWNLOAD_DIR = os.getenv('DOWNLOAD_DIR', './data/downloads')
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+DOWNLOAD_TIMEOUT = 60  # seconds without data before giving up on a connection
+DOWNLOAD_RETRIES = int(os.getenv('DOWNLOAD_RETRIES', 5))
+# partial downloads no retry resumed for this long belong to episodes that were given up on
+DOWNLOAD_STALE_SECONDS = 24 * 3600
+
+def content_range_total(response):
+    """Total size from a `Content-Range: bytes 100-199/2000` header"""
+    total = response.headers.get('Content-Range', '').rpartition('/')[2]
+    return int(total) if total.isdigit() else None
+
+def print_progress(url):
+    reported = [0]
+
+    def on_progress(done, total):
+        if total:
+            percent = done * 100 // total
+            if percent >= reported[0] + 10 or done == total:
+                reported[0] = percent
+                print(f"Downloaded {percent}% ({done / 1e6:.1f}/{total / 1e6:.1f} MB) of {url}")
+        elif done - reported[0] >= 10 * 1024 * 1024:
+            reported[0] = done
+            print(f"Downloaded {done / 1e6:.1f} MB of {url}")
+    return on_progress
+
+def _download_attempt(url, path, on_progress):
+    """Stream into `path`, continuing from its current size, returns (bytes on disk, total or None)"""
+    offset = os.path.getsize(path) if os.path.exists(path) else 0
+    headers = dict(DOWNLOAD_HEADERS)
+    if offset:
+        headers['Range'] = f"bytes={offset}-"
+
+    with requests.get(url, allow_redirects=True, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code == 416 and offset:
+            # nothing left after offset: the partial file is already complete
+            return offset, content_range_total(response)
+        if response.status_code == 206:
+            total = content_range_total(response)
+            mode = 'ab'
+        elif response.status_code == 200:
+            # no range support, start over
+            offset = 0
+            length = response.headers.get('Content-Length', '')
+            total = int(length) if length.isdigit() else None
+            mode = 'wb'
+        else:
+            raise Exception(f"Failed to download file: {response.status_code}")
+
+        if offset:
+            print(f"Resuming download of {url} at {offset / 1e6:.1f} MB")
+        with open(path, mode) as file:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+                file.write(chunk)
+                offset += len(chunk)
+                on_progress(offset, total)
+    return offset, total
+
+def try_lock(lock_path, lock):
+    """Non-blocking exclusive lock on the open `lock`, False if another job holds it
+
+    Also False if `lock_path` was removed or replaced since it was opened: the job
+    that finished with it deleted it, a lock on the old file protects nothing.
+    """
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    try:
+        return os.stat(lock_path).st_ino == os.fstat(lock.fileno()).st_ino
+    except FileNotFoundError:
+        return False
+
+@contextmanager
+def partial_download_path(url, path):
+    """Shared partial file for `url` if no other job is downloading it, else a private one next to `path`
+
+    The lock is held until the block exits, it goes away with the process if that dies.
+    The lock file is removed once the download completed, the partial file then has
+    been moved to `path`.
+    """
+    Path(DOWNLOAD_DIR).mkdir(parents=True, exist_ok=True)
+    base = os.path.join(DOWNLOAD_DIR, content_hash(url)[:16])
+    lock_path = f"{base}.lock"
+    with open(lock_path, "a") as lock:
+        locked = try_lock(lock_path, lock)
+        if not locked:
+            print(f"{url} is being downloaded by another job, downloading a separate copy")
+        # closing the file releases the lock
+        yield f"{base}.part" if locked else f"{path}.part"
+        if locked:
+            os.remove(lock_path)
+
+def remove_stale_downloads(max_age=DOWNLOAD_STALE_SECONDS):
+    """Remove partial downloads and lock files left by episodes that were given up on, returns how many"""
+    removed = 0
+    cutoff = time.time() - max_age
+    for lock_path in Path(DOWNLOAD_DIR).glob('*.lock'):
+        part_path = lock_path.with_suffix('.part')
+        try:
+            if max(p.stat().st_mtime for p in (lock_path, part_path) if p.exists()) >= cutoff:
+                continue
+            with open(lock_path, "a") as lock:
+                # a job still holding it resumes the download
+                if not try_lock(str(lock_path), lock):
+                    continue
+                part_path.unlink(missing_ok=True)
+                lock_path.unlink()
+                removed += 1
+        except (OSError, ValueError):
+            pass
+    return removed
+
+def ensure_download_space(size=None):
+    """Downloads are written to DOWNLOAD_DIR before moving to the job dir, if that is
+    another disk than WORK_DIR's check it has room for the download too"""
+    Path(DOWNLOAD_DIR).mkdir(parents=True, exist_ok=True)
+    if os.stat(DOWNLOAD_DIR).st_dev == os.stat(WORK_DIR).st_dev:
+        # counted by the job dir's estimate
+        return
+    ensure_disk_space(int(size) if size else 200 * 1024 * 1024, DOWNLOAD_DIR)
+
+def download_file(url, path, expected_size=None, on_progress=None):
+    """Download `url` to `path` in chunks, resuming with Range requests after failures
+
+    `expected_size` (e.g. Pocket Casts' `size`) is checked when the server does not
+    report a length. Returns the number of bytes downloaded.
+    """
+    on_progress = on_progress or print_progress(url)
+    with partial_download_path(url, path) as partial_path:
+        return _download_to(url, path, partial_path, expected_size, on_progress)
+
+def _download_to(url, path, partial_path, expected_size, on_progress):
+    for attempt in range(1, DOWNLOAD_RETRIES + 1):
+        try:
+            size, total = _download_attempt(url, partial_path, on_progress)
+            total = total or expected_size
+            if total and size < total:
+                raise IOError(f"Connection closed after {size} of {total} bytes")
+            if total and size > total:
+                # stale partial file from a different version of the episode
+                os.remove(partial_path)
+                raise IOError(f"Downloaded {size} bytes, more than the expected {total}")
+            break
+        except (requests.RequestException, IOError) as e:
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            delay = min(30, 2 ** attempt)
+            print(f"Download of {url} failed (attempt {attempt}): {e}, retrying in {delay}s")
+            time.sleep(delay)
+
+    if expected_size and size != expected_size:
+        # the reported size is often off for feeds with dynamically inserted ads
+        print(f"Warning: downloaded {size} bytes of {url}, Pocket Casts reported {expected_size}")
+    shutil.move(partial_path, path)
+    return size
+
+def download_audio(url, filename, expected_size=None):
     url_extension = url.split(".")[-1]
     filename_with_ext = f"{filename}.{url_extension}"
 
-    response = requests.get(url, allow_redirects=True, headers=headers)
-    if response.status_code != 200:
-        raise Exception(f"Failed to download file: {response.status_code}")
-
-    with open(filename_with_ext, "wb") as file:
-        file.write(response.content)
-    if whisper_local:
-        return filename_with_ext
-    else:
-        return split_mp3(filename_with_ext)
+    with span('download', url=url) as stats:
+        stats['bytes'] = download_file(url, filename_with_ext, int(expected_size) if expected_size else None)
+    return filename_with_ext
 
-def transcribe_audio(file_path):
+async def transcribe_audio(file_path, prompt=None):
+    """Returns (text, segments, audio seconds) of one file"""
     print(f"Transcribing {file_path}")
-    with open(file_path, "rb") as audio_file:
-        response = client.audio.transcriptions.create(
+    options = {'prompt': prompt} if prompt else {}
+    with span('whisper_api', bytes=os.path.getsize(file_path)), WHISPER_SECONDS.time(backend='api'), open(file_path, "rb") as audio_file:
+        response = await client.audio.transcriptions.create(
             model="whisper-1",
-            file=audio_file
+            file=audio_file,
+            response_format="verbose_json",
+            **options
         )
-        print(f"Transcription for {file_path}: {response.text}")
-        return response.text
+        print(f"Transcription for {file_path}: {response.text[0:100]}")
+        segments = transcript_segments.from_verbose_json(getattr(response, 'segments', None))
+        duration = getattr(response, 'duration', None) or (segments[-1].end if segments else 0)
+        return response.text, segments, float(duration)
+
+async def transcribe_parts(part_names, show_notes):
+    """Transcribe the parts of one episode concurrently, returns their texts in order
+    and the segments of all parts with times from the start of the first one
+
+    Every part is prompted with the show notes for names and terms. The tail of the
+    previous part is added to the prompt only when parts run one at a time
+    (WHISPER_API_CONCURRENCY=1), as concurrent parts can't wait for it.
+    """
+    slots = asyncio.Semaphore(WHISPER_API_CONCURRENCY)
+    results = [None] * len(part_names)
+    notes = (show_notes or '')[:PROMPT_NOTES_CHARS]
 
-async def transcribe_audio_with_local_whisper(file_path, show_notes):
+    async def transcribe_part(index, part_name):
+        # waiters acquire in order, so with one slot the previous part is done here
+        async with slots:
+            prompt = notes
+            if WHISPER_API_CONCURRENCY == 1 and index > 0 and results[index - 1]:
+                prompt = f"{notes}\n{results[index - 1][0][-PROMPT_TAIL_CHARS:]}"
+            results[index] = await transcribe_audio(part_name, prompt)
+
+    await asyncio.gather(*(transcribe_part(i, name) for i, name in enumerate(part_names)))
+    segments, offset = [], 0.0
+    for _, part_segments, duration in results:
+        segments += transcript_segments.shift(part_segments, offset)
+        offset += duration
+    return [text for text, _, _ in results], segments
+
+async def transcribe_audio_with_local_whisper(file_path, show_notes, kept=None):
+    """`kept` limits whisper to these (start, end) ranges of the file
+
+    Returns (text, segments), segment times are in the audio whisper saw.
+    """
     print(f"Transcribing w/ local whisper {file_path} with show notes {show_notes}")
 
-    if not file_path.endswith(".wav"):
-        convert_cmd = [
-            "ffmpeg", "-y", "-i", file_path,
-            "-ar", "16000", "-ac", "1", "-c:a", "pcm_s16le", "temp_audio.wav"
-        ]
-        subprocess.run(convert_cmd, check=True)
-        file_path = "temp_audio.wav"
+    started = time.perf_counter()
+    with span('whisper', bytes=os.path.getsize(file_path), server=bool(whisper_server)) as stats:
+        if whisper_server:
+            transcription, segments, audio_seconds = await stream_to_server(file_path, show_notes, kept)
+        else:
+            async with scheduler.slot() as run:
+                stats['threads'] = run.threads
+                transcription, segments, audio_seconds = await run_whisper_cli(file_path, show_notes, run.threads, kept)
+                run.done(audio_seconds)
+        stats['audio_seconds'] = round(audio_seconds, 1)
+    elapsed = time.perf_counter() - started
+    WHISPER_SECONDS.observe(elapsed, backend='server' if whisper_server else 'local')
+    if audio_seconds > 0:
+        WHISPER_RTF.observe(elapsed / audio_seconds)
+
+    return transcription, segments
+
+def share_cpu(processes):
+    """Give this process 1/`processes` of the cores, when that many worker processes run local whisper"""
+    global scheduler
+    if processes > 1:
+        cores = max(1, available_cores() // processes)
+        print(f"Whisper scheduler: {cores} of {available_cores()} cores for each of {processes} processes")
+        scheduler = WhisperScheduler(cores=cores, jobs=WHISPER_JOBS, threads=WHISPER_THREADS)
 
+async def run_whisper_cli(file_path, show_notes, threads=8, kept=None):
+    """One-off whisper-cli run reading the audio decoded by ffmpeg from stdin, no wav on disk
+
+    The timed segments are written by whisper-cli as json next to the audio.
+    Returns (transcript, segments, audio seconds).
+    """
+    output_base = os.path.splitext(file_path)[0] + ".whisper"
     whisper_cmd = [
         f"{whisper_local}/build/bin/whisper-cli",
-        "-f", file_path,
-        "-m", f"{whisper_local}/models/ggml-large-v3-turbo-q5_0.bin",
+        "-f", "-",
+        "-m", f"{whisper_local}/models/{WHISPER_MODEL}",
         "--prompt", f'"{show_notes}"',
-        "-t", "8",
-        "--output-txt"
+        "-t", str(threads),
+        "--no-timestamps",
+        *VAD_ARGS,
+        # full json: segment offsets plus token probabilities for avg_logprob
+        "-ojf", "-of", output_base
     ]
+    info = asyncio.create_task(asyncio.to_thread(probe, file_path))
+    read_fd, write_fd = os.pipe()
+    try:
+        decoder = await asyncio.create_subprocess_exec(*decode_command(file_path, segments=kept), stdout=write_fd, stderr=subprocess.PIPE)
+        proc = await asyncio.create_subprocess_exec(
+            *whisper_cmd,
+            stdin=read_fd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+    finally:
+        # the children hold their own copies of the pipe ends
+        os.close(read_fd)
+        os.close(write_fd)
+    (stdout, stderr), (_, decode_errors) = await asyncio.gather(proc.communicate(), decoder.communicate())
+
+    print(f'[{whisper_cmd!r} exited with {proc.returncode}]')
+    if stderr:
+        print(f"[stderr]\n{stderr.decode('utf-8', errors='ignore')}")
+    # when whisper-cli dies, ffmpeg fails writing to the closed pipe: report whisper's error then
+    decoder_broken_pipe = decoder.returncode == -signal.SIGPIPE or b'Broken pipe' in decode_errors
+    if decoder.returncode != 0 and (proc.returncode == 0 or not decoder_broken_pipe):
+        raise Exception(f"ffmpeg failed to decode {file_path}: {decode_errors.decode('utf-8', errors='ignore')[-1000:]}")
+    if proc.returncode != 0:
+        raise Exception(f"whisper-cli exited with {proc.returncode}: {stderr.decode('utf-8', errors='ignore')[-1000:]}")
+    lines = stdout.decode('utf-8', errors='ignore').splitlines()
+    with open(f"{output_base}.json", encoding='utf-8', errors='ignore') as f:
+        segments = transcript_segments.from_whisper_cpp(json.load(f))
+    duration = (await info)['duration']
+    audio_seconds = sum(end - start for start, end in kept) if kept else duration
+    return "\n".join(line.strip() for line in lines if line.strip()), segments, audio_seconds
+
+async def stream_to_server(file_path, show_notes, kept=None):
+    """Send the audio to the whisper server in chunks as ffmpeg decodes it
 
-    proc = await asyncio.create_subprocess_exec(
-        *whisper_cmd,
+    The next chunk is decoded while the server transcribes the current one, each
+    chunk is prompted with the end of the previous transcript. Returns (transcript, segments, audio seconds).
+    """
+    decoder = await asyncio.create_subprocess_exec(
+        *decode_command(file_path, 's16le', kept),
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE
     )
-    stdout, stderr = await proc.communicate()
+    chunk_bytes = STREAM_CHUNK_SECONDS * PCM_BYTES_PER_SECOND
+    texts, segments, pending, pending_offset, total_bytes = [], [], None, 0.0, 0
 
-    print(f'[{whisper_cmd!r} exited with {proc.returncode}]')
-    if stdout:
-        print(f"[stdout]\n{stdout.decode('utf-8', errors='ignore')}")
-    if stderr:
-        print(f"[stderr]\n{stderr.decode('utf-8', errors='ignore')}")
+    async def read_chunk():
+        try:
+            return await decoder.stdout.readexactly(chunk_bytes)
+        except asyncio.IncompleteReadError as e:
+            return e.partial
 
-    # FIXME: Race condition: might be overwritten by the other process
-    with open("temp_audio.wav.txt", "r") as f:
-        transcription = f.read()
+    try:
+        while True:
+            pcm = await read_chunk()
+            if pending:
+                response = await pending
+                texts.append(response['text'])
+                segments += transcript_segments.shift(
+                    transcript_segments.from_verbose_json(response.get('segments')), pending_offset
+                )
+                pending = None
+            if not pcm:
+                break
+            pending_offset = total_bytes / PCM_BYTES_PER_SECOND
+            total_bytes += len(pcm)
+            prompt = f"{show_notes}\n{texts[-1][-PROMPT_TAIL_CHARS:]}" if texts else show_notes
+            pending = asyncio.create_task(asyncio.to_thread(whisper_server.inference, wav_bytes(pcm), prompt))
+        decode_errors = await decoder.stderr.read()
+        if await decoder.wait() != 0:
+            raise Exception(f"ffmpeg failed to decode {file_path}: {decode_errors.decode('utf-8', errors='ignore')[-1000:]}")
+    finally:
+        if decoder.returncode is None:
+            decoder.kill()
+            await decoder.wait()
+    return "\n".join(text.strip() for text in texts), segments, total_bytes / PCM_BYTES_PER_SECOND
 
-    return [transcription]
+def find_sound(audio_path):
+    """(start, end) of the file without silences longer than TRIM_MIN_SILENCE
 
-async def transcribe_from_url(audio_url, show_notes):
-    local_filename = "temp_audio"
+    Uses ffmpeg's silencedetect, so only quiet gaps are dropped, music and ads stay.
+    Returns None when there is little to drop. Whisper sees the kept ranges joined
+    together, segments.to_original maps its times back to the file.
+    """
+    with span('trim_silence', bytes=os.path.getsize(audio_path)) as stats:
+        duration = probe(audio_path)['duration']
+        kept = sound_segments(detect_silences(audio_path, min_seconds=TRIM_MIN_SILENCE), duration)
+        kept_seconds = sum(end - start for start, end in kept)
+        stats['audio_seconds'] = round(duration, 1)
+        stats['kept_seconds'] = round(kept_seconds, 1)
+    if not kept:
+        print(f"Only silence found in {audio_path}, transcribing all of it")
+        return None
+    if kept_seconds > duration * (1 - TRIM_MIN_SAVING):
+        return None
+    print(f"Trimmed silence: kept {kept_seconds:.0f}s out of {duration:.0f}s in {len(kept)} ranges")
+    return kept
+
+def estimate_disk_usage(size=None):
+    """Bytes a job writes: the download, plus the split parts for the API
+    (local whisper reads the decoded audio from a pipe)"""
+    size = int(size) if size else 200 * 1024 * 1024
+    if use_whisper_cpp:
+        return size
+    return size * 2
+
+async def warm_up():
+    """Start the whisper server if configured, so the first episode doesn't wait for the model to load,
+    and clean up partial downloads nobody is going to resume"""
     try:
-        part_names = download_audio(audio_url, local_filename)
-        if whisper_local:
-            transcriptions = await transcribe_audio_with_local_whisper(part_names, show_notes)
-        else:
-            transcriptions = [transcribe_audio(part_name) for part_name in part_names]
-        transcription_lines = "/n".join(transcriptions)
-        return transcription_lines
+        removed = await asyncio.to_thread(remove_stale_downloads)
+        if removed:
+            print(f"Removed {removed} stale partial downloads from {DOWNLOAD_DIR}")
     except Exception as e:
+        print(f"Failed to remove stale partial downloads: {e}")
+    if whisper_server:
+        try:
+            await asyncio.to_thread(whisper_server.ensure_started)
+        except Exception as e:
+            print(f"Failed to start whisper server, will retry on the first episode: {e}")
+
+async def transcribe_from_url(audio_url, show_notes, size=None):
+    """Transcribe the audio at `audio_url`, the episode's `size` is used if known
+
+    Returns (text, timed segments), segments are None when not available, or None on failure.
+    """
+    if offline.OFFLINE:
+        return await offline.transcribe_from_url(audio_url, show_notes), None
+    return await _transcribe_from_url(audio_url, show_notes, size)
+
+def transcription_settings(show_notes):
+    """Everything besides the audio that changes the transcript, part of the cache key"""
+    trim = ('trim',) if WHISPER_TRIM_SILENCE else ()
+    if use_whisper_cpp:
+        vad = ('vad',) if VAD_ARGS else ()
+        return ('local', WHISPER_MODEL, show_notes, *trim, *vad)
+    upload = (WHISPER_UPLOAD_CODEC,) if WHISPER_UPLOAD_CODEC else ()
+    return ('api', 'whisper-1', show_notes, *trim, *upload)
+
+async def _transcribe_from_url(audio_url, show_notes, size=None):
+    try:
+        cache = get_transcript_cache()
+        settings = transcription_settings(show_notes)
+        url_alias = cache.url_key(audio_url, *settings)
+        key = cache.resolve(url_alias)
+        cached = cache.get(key) if key else None
+        if cached is not None:
+            print(f"Using cached transcription of {audio_url}")
+            TRANSCRIPTIONS.inc(backend=settings[0], result='cached')
+            return cached, cached_segments(key)
+
+        # every job gets its own directory, so concurrent jobs don't overwrite each other's files
+        with job_dir('transcribe', needed=estimate_disk_usage(size)) as work_dir:
+            ensure_download_space(size)
+            local_filename = os.path.join(work_dir, "audio")
+            # streaming the download is blocking, keep it off the event loop
+            audio_path = await asyncio.to_thread(download_audio, audio_url, local_filename, size)
+
+            # the same audio under another url, e.g. an episode in two feeds
+            key = cache.key(await asyncio.to_thread(file_hash, audio_path), *settings)
+            cached = cache.get(key)
+            if cached is not None:
+                print(f"Using cached transcription of the same audio for {audio_url}")
+                cache.put(key, cached, aliases=[url_alias])
+                TRANSCRIPTIONS.inc(backend=settings[0], result='cached')
+                return cached, cached_segments(key)
+
+            kept = await asyncio.to_thread(find_sound, audio_path) if WHISPER_TRIM_SILENCE else None
+            if use_whisper_cpp:
+                transcription, segments = await transcribe_audio_with_local_whisper(audio_path, show_notes, kept)
+                transcriptions = [transcription]
+            else:
+                if WHISPER_UPLOAD_CODEC:
+                    audio_path = await asyncio.to_thread(
+                        transcode, audio_path, os.path.join(work_dir, "upload"), WHISPER_UPLOAD_CODEC, kept
+                    )
+                elif kept:
+                    audio_path = await asyncio.to_thread(
+                        extract_segments, audio_path, os.path.join(work_dir, "trimmed.mp3"), kept
+                    )
+                part_names = await asyncio.to_thread(split_mp3, audio_path, os.path.join(work_dir, "output_part_"))
+                transcriptions, segments = await transcribe_parts(part_names, show_notes)
+        transcription_lines = "\n".join(transcriptions)
+        segments = transcript_segments.to_original(segments, kept)
+        cache.put(key, transcription_lines, aliases=[url_alias], segments=transcript_segments.dumps(segments))
+        TRANSCRIPTIONS.inc(backend=settings[0], result='ok')
+        return transcription_lines, segments
+    except Exception as e:
+        TRANSCRIPTIONS.inc(backend='local' if use_whisper_cpp else 'api', result='error')
         print(f"Error during transcription: {e}")
         print(f"stack trace: {traceback.format_exc()}")
         return None
 
+def cached_segments(key):
+    data = get_transcript_cache().get_segments(key)
+    return transcript_segments.loads(data) if data else None
+
+def transcode(input_path, output_base, codec, kept=None):
+    with span('transcode', bytes=os.path.getsize(input_path), codec=codec) as stats:
+        output_path = transcode_for_upload(input_path, output_base, codec, kept)
+        stats['output_bytes'] = os.path.getsize(output_path)
+    print(f"Transcoded {input_path} to {codec}: {os.path.getsize(input_path) / 1e6:.1f} MB -> {stats['output_bytes'] / 1e6:.1f} MB")
+    return output_path
+
 def split_mp3(input_path, output_prefix="output_part_", target_mb=20):
     """
-    Split an MP3 file into chunks smaller than specified megabytes
-    Works best with constant bitrate (CBR) MP3 files
+    Split an audio file into chunks smaller than specified megabytes (the API upload limit is 25)
+    MP3 is cut without re-encoding, other formats are transcoded to mp3
 
-    :param input_path: Path to input MP3 file
+    :param input_path: Path to input audio file
     :param output_prefix: Prefix for output files
     :param target_mb: Target maximum size in megabytes (default 20)
     """
-    # Get file size and calculate target bytes
-    file_size_bytes = os.path.getsize(input_path)
-    target_bytes = target_mb * 1024 * 1024  # Convert MB to bytes
-
-    # Load audio file
-    audio = AudioSegment.from_mp3(input_path)
-
-    # Calculate duration and bitrate
-    duration_sec = len(audio) / 1000  # Audio length in seconds
-    bitrate_bps = (file_size_bytes * 8) / duration_sec  # bits per second
-    print(f"Length: {duration_sec} s, Bitrate: {bitrate_bps / 1000} kbps")
-
-    # Calculate chunk duration needed to stay under target size
-    chunk_duration_sec = (target_bytes * 8) / bitrate_bps
-    chunk_length_ms = chunk_duration_sec * 1000  # Convert to milliseconds
-
-    # Create chunks
-    chunks = make_chunks(audio, chunk_length_ms)
-
-    # Export with the same calculated bitrate
-    bitrate_str = f"{int(bitrate_bps // 1000)}k"
-    chunk_names = []
-    for i, chunk in enumerate(chunks):
-        chunk_name = f"{output_prefix}{i+1}.mp3"
-        chunk.export(chunk_name, format="mp3", bitrate=bitrate_str)
-        print(f"Exported {chunk_name}")
-        chunk_names.append(chunk_name)
-
-    return chunk_names
+    with span('split_mp3', bytes=os.path.getsize(input_path)) as stats:
+        parts = split_audio(input_path, output_prefix, target_mb * 1024 * 1024)
+        stats['parts'] = len(parts)
+        return parts
 
 if __name__ == "__main__":
     # Example Usage
@@ -0,0 +1,184 @@
+import asyncio
+import fcntl
+import json
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+WHISPER_STATS_FILE = os.getenv('WHISPER_STATS_FILE', './data/whisper_rtf.json')
+# runs of a configuration before its real-time factor is trusted
+MIN_SAMPLES = 3
+# whisper.cpp stops scaling well past this many threads per job
+MAX_THREADS_PER_JOB = 8
+# every whisper-cli run loads its own copy of the model
+MAX_JOBS = int(os.getenv('WHISPER_MAX_JOBS', 4))
+
+Config = Tuple[int, int]  # (concurrent jobs, threads per job)
+
+
+def available_cores() -> int:
+    """CPUs this process may use: affinity mask, capped by a cgroup v2 cpu quota"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    try:
+        quota, period = Path('/sys/fs/cgroup/cpu.max').read_text().split()
+        if quota != 'max':
+            cores = min(cores, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def candidate_configs(cores: int, max_jobs: int = MAX_JOBS, max_threads: int = MAX_THREADS_PER_JOB,
+                      jobs: Optional[int] = None, threads: Optional[int] = None) -> List[Config]:
+    """Splits of `cores` into jobs x threads that don't oversubscribe, largest jobs first
+
+    Threads per job are powers of two, `jobs` or `threads` pin that side of the split.
+    """
+    if jobs and threads:
+        return [(jobs, threads)]
+    if jobs:
+        return [(jobs, max(1, min(max_threads, cores // jobs)))]
+    if threads:
+        return [(max(1, min(max_jobs, cores // threads)), threads)]
+    configs = []
+    threads = 1
+    while threads <= min(max_threads, cores):
+        configs.append((min(max_jobs, cores // threads), threads))
+        threads *= 2
+    # with fewer jobs allowed than cores, small thread counts leave cores idle
+    return [c for c in configs if c[0] * c[1] * 2 > min(cores, max_jobs * max_threads)] or [configs[-1]]
+
+
+def config_name(config: Config) -> str:
+    return f'{config[0]}x{config[1]}'
+
+
+class WhisperScheduler:
+    """Decides how many local whisper jobs run at once and with how many threads each
+
+    Every finished job records its real-time factor (processing time / audio time)
+    under the configuration it was started with, together with how many jobs were
+    actually running next to it. The score of a configuration is the audio seconds
+    transcribed per second of wall time (running jobs / RTF), so a split with more
+    jobs than there is work for doesn't look better than it is. Configurations with
+    fewer than MIN_SAMPLES runs are tried first. Pinning both `jobs` and `threads`
+    disables the search.
+
+    Each process has its own scheduler, worker processes split the machine by
+    passing their share as `cores` (see whisper.share_cpu). The stats file is
+    shared and updated under a lock.
+    """
+
+    def __init__(self, cores: Optional[int] = None, jobs: Optional[int] = None, threads: Optional[int] = None,
+                 max_jobs: int = MAX_JOBS, stats_file: str = WHISPER_STATS_FILE):
+        self.cores = cores or available_cores()
+        self.configs = candidate_configs(self.cores, max_jobs, jobs=jobs, threads=threads)
+        self.stats_file = stats_file
+        self.stats: Dict[str, Dict[str, float]] = self._load()
+        self.config = self.choose()
+        self.active: List['Run'] = []
+        self._changed: Optional[asyncio.Condition] = None
+
+    @property
+    def changed(self) -> asyncio.Condition:
+        # created on first use, inside the event loop that runs the jobs
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    def _load(self) -> Dict[str, Dict[str, float]]:
+        try:
+            with open(self.stats_file) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save(self):
+        tmp_path = f'{self.stats_file}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.stats, f, indent=1)
+        os.replace(tmp_path, self.stats_file)
+
+    @contextmanager
+    def _locked_stats(self):
+        """Re-read the stats under a lock so runs recorded by other processes are kept"""
+        Path(self.stats_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(f'{self.stats_file}.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.stats = self._load()
+            yield self.stats
+            self._save()
+
+    def throughput(self, config: Config) -> Optional[float]:
+        """Mean audio seconds transcribed per wall second, None until MIN_SAMPLES runs"""
+        stats = self.stats.get(config_name(config))
+        if not stats or stats['runs'] < MIN_SAMPLES:
+            return None
+        return stats['throughput'] / stats['runs']
+
+    def choose(self) -> Config:
+        for config in self.configs:
+            if self.throughput(config) is None:
+                return config
+        return max(self.configs, key=self.throughput)
+
+    def record(self, config: Config, jobs: int, audio_seconds: float, elapsed: float):
+        """Add a finished run of `config` that had `jobs` jobs running at most"""
+        if audio_seconds <= 0 or elapsed <= 0:
+            return
+        try:
+            with self._locked_stats() as all_stats:
+                stats = all_stats.setdefault(config_name(config), {
+                    'runs': 0, 'audio_seconds': 0, 'processing_seconds': 0, 'throughput': 0
+                })
+                stats['runs'] += 1
+                stats['audio_seconds'] += audio_seconds
+                stats['processing_seconds'] += elapsed
+                stats['throughput'] += jobs * audio_seconds / elapsed
+        except IOError as e:
+            print(f"Failed to save whisper stats: {e}")
+        chosen = self.choose()
+        if chosen != self.config:
+            print(f"Whisper scheduler: switching from {config_name(self.config)} to {config_name(chosen)} "
+                  f"({self.cores} cores)")
+            self.config = chosen
+
+    def _can_start(self) -> bool:
+        jobs, threads = self.config
+        return len(self.active) < jobs and sum(r.threads for r in self.active) + threads <= self.cores
+
+    @asynccontextmanager
+    async def slot(self):
+        """Wait for a job slot, yields a Run whose `threads` whisper should use
+
+        Call `run.done(audio_seconds)` after a successful transcription to record it.
+        """
+        async with self.changed:
+            await self.changed.wait_for(self._can_start)
+            run = Run(self, self.config)
+            self.active.append(run)
+            for other in self.active:
+                other.peak_jobs = max(other.peak_jobs, len(self.active))
+        try:
+            yield run
+        finally:
+            async with self.changed:
+                self.active.remove(run)
+                self.changed.notify_all()
+
+
+class Run:
+    def __init__(self, scheduler: WhisperScheduler, config: Config):
+        self.scheduler = scheduler
+        self.config = config
+        self.threads = config[1]
+        self.peak_jobs = 1
+        self.started = time.perf_counter()
+
+    def done(self, audio_seconds: float):
+        self.scheduler.record(self.config, self.peak_jobs, audio_seconds, time.perf_counter() - self.started)
@@ -0,0 +1,103 @@
+import atexit
+import subprocess
+import threading
+import time
+from typing import Dict, Optional, Sequence
+
+import requests
+
+
+class WhisperServer:
+    """A long-running whisper.cpp `whisper-server` that keeps the model loaded between episodes
+
+    Started on first use and health-checked before each request, restarted if it died.
+    With `url` set it talks to a server started elsewhere (e.g. shared by several
+    worker processes) and never starts or stops one itself.
+    """
+
+    def __init__(self, binary: str, model: str, host: str = '127.0.0.1', port: int = 8178,
+                 threads: int = 8, url: Optional[str] = None, startup_timeout: float = 300,
+                 extra_args: Sequence[str] = ()):
+        self.binary = binary
+        self.model = model
+        self.host = host
+        self.port = port
+        self.threads = threads
+        self.external = url is not None
+        self.url = (url or f'http://{host}:{port}').rstrip('/')
+        self.startup_timeout = startup_timeout
+        self.extra_args = list(extra_args)
+        self.proc: Optional[subprocess.Popen] = None
+        self.lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def healthy(self) -> bool:
+        try:
+            return requests.get(f'{self.url}/health', timeout=2).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def ensure_started(self):
+        with self.lock:
+            if self.healthy():
+                return
+            if self.external:
+                raise Exception(f"whisper server at {self.url} is not healthy")
+            if self.proc is None or self.proc.poll() is not None:
+                self._start()
+            self._wait_until_healthy()
+
+    def _start(self):
+        cmd = [
+            self.binary,
+            '-m', self.model,
+            '--host', self.host,
+            '--port', str(self.port),
+            '-t', str(self.threads),
+            *self.extra_args,
+        ]
+        print(f"Starting whisper server: {' '.join(cmd)}")
+        # logs go to our stderr, an unread pipe would fill up and block the server
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+
+    def _wait_until_healthy(self):
+        deadline = time.time() + self.startup_timeout
+        while time.time() < deadline:
+            if self.proc is not None and self.proc.poll() is not None:
+                raise Exception(f"whisper server exited with {self.proc.returncode}, see its log above")
+            if self.healthy():
+                print(f"whisper server ready at {self.url}")
+                return
+            # /health answers 503 while the model is loading
+            time.sleep(1)
+        raise Exception(f"whisper server at {self.url} not ready after {self.startup_timeout}s")
+
+    def inference(self, wav: bytes, prompt: Optional[str] = None, timeout: float = 3600) -> Dict:
+        """Transcribe 16 kHz mono wav data, returns the `verbose_json` response (text and timed segments)"""
+        for attempt in (1, 2):
+            self.ensure_started()
+            try:
+                response = requests.post(
+                    f'{self.url}/inference',
+                    files={'file': ('audio.wav', wav, 'audio/wav')},
+                    data={'response_format': 'verbose_json', 'temperature': '0.0', 'prompt': prompt or ''},
+                    timeout=timeout,
+                )
+            except requests.ConnectionError:
+                # the server died mid-request, start it again once
+                if attempt == 2 or self.external:
+                    raise
+                print("whisper server connection lost, restarting")
+                continue
+            if response.status_code != 200:
+                raise Exception(f"whisper server inference failed: {response.status_code} {response.text[:500]}")
+            return response.json()
+
+    def stop(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.proc = None
@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+WORK_DIR = os.getenv('WORK_DIR', './data/work')
+# keep this much free on top of what a job is expected to write
+MIN_FREE_BYTES = int(os.getenv('MIN_FREE_MB', 1024)) * 1024 * 1024
+# job directories older than this were left behind by a killed process
+STALE_SECONDS = 6 * 3600
+JOB_PREFIX = 'job-'
+
+
+class DiskSpaceError(IOError):
+    pass
+
+
+def free_bytes(path: str) -> int:
+    return shutil.disk_usage(path).free
+
+
+def remove_stale_job_dirs(root: str = WORK_DIR, max_age: float = STALE_SECONDS) -> int:
+    """Remove job directories a crashed worker did not clean up, returns how many were removed"""
+    removed = 0
+    cutoff = time.time() - max_age
+    for path in Path(root).glob(f'{JOB_PREFIX}*'):
+        try:
+            if path.is_dir() and path.stat().st_mtime < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def ensure_disk_space(needed: int, root: str = WORK_DIR, min_free: int = MIN_FREE_BYTES):
+    """Raise DiskSpaceError unless `needed` bytes fit in `root` with `min_free` to spare"""
+    Path(root).mkdir(parents=True, exist_ok=True)
+    if free_bytes(root) - needed >= min_free:
+        return
+    if remove_stale_job_dirs(root) and free_bytes(root) - needed >= min_free:
+        return
+    raise DiskSpaceError(
+        f"Not enough disk space in {root}: {free_bytes(root) / 1e6:.0f} MB free, "
+        f"job needs {needed / 1e6:.0f} MB plus {min_free / 1e6:.0f} MB reserve"
+    )
+
+
+@contextmanager
+def job_dir(name: str = '', needed: Optional[int] = None, root: str = WORK_DIR):
+    """Private working directory for one job, removed when the block exits"""
+    if needed:
+        ensure_disk_space(needed, root)
+    Path(root).mkdir(parents=True, exist_ok=True)
+    path = tempfile.mkdtemp(prefix=f'{JOB_PREFIX}{name}-', dir=root)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
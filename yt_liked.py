@@ -5,6 +5,7 @@ import google.auth
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from env import *
+import offline
 
 credential = None
 SCOPES = ["https://www.googleapis.com/auth/youtube.readonly"]
@@ -113,6 +114,8 @@ def get_playlist_videos(youtube, playlist_id):
     return video_list
 
 def get_youtube_liked_videos():
+    if offline.OFFLINE:
+        return offline.youtube_liked_videos()
     youtube = authenticate_youtube()
     return get_liked_videos(youtube)
 
@@ -1,7 +1,10 @@
 import os
 from env import *
+import offline
+from tracing import span
 import asyncio
 import requests
+from retry import MissingData
 
 from youtube_transcript_api import YouTubeTranscriptApi
 from bilibili_api import video, Credential
@@ -12,12 +15,17 @@ def format_caption(caption):
     return "\n".join([f"{line.start} - {line.duration}: {line.text}" for line in caption])
 
 async def download_caption(video_url):
-    if "youtube" in video_url:
-        return download_caption_youtube(video_url)
-    elif "bilibili" in video_url:
-        return await download_caption_bilibili(video_url)
-    else:
-        return "Unsupported video platform"
+    with span('caption_download', url=video_url) as stats:
+        if offline.OFFLINE:
+            caption = await offline.download_caption(video_url)
+        elif "youtube" in video_url:
+            caption = await asyncio.to_thread(download_caption_youtube, video_url)
+        elif "bilibili" in video_url:
+            caption = await download_caption_bilibili(video_url)
+        else:
+            return "Unsupported video platform"
+        stats['chars'] = len(caption)
+        return caption
 
 def download_caption_youtube(video_url):
     video_id = video_url.split("v=")[1]
@@ -47,7 +55,10 @@ async def download_caption_bilibili(video_url):
         info = await v.get_info()
         cid = info['pages'][0]['cid']
         subtitle_info = await v.get_subtitle(cid)
-        subtitle_url = subtitle_info['subtitles'][0]['subtitle_url']
+        subtitles = subtitle_info.get('subtitles') or []
+        if not subtitles:
+            raise MissingData(f"No subtitles for {video_url}")
+        subtitle_url = subtitles[0]['subtitle_url']
         subtitle_json = requests.get('https:' + subtitle_url).json()
         subittle_text = '\n'.join(map(lambda line: line['content'], subtitle_json['body']))
         return subittle_text